@@ -3,7 +3,8 @@
 # * Filename:         auto_start.sh
 # * Description:      This shell script is executed when the Raspberry Pi boots up. It sets up the necessary
 #                      environment variables to run graphical applications and Python modules, then launches
-#                      the main application. Alternatively the applications "image_collect_train_od.py" or
+#                      the main application. The main application runs headless, so it does not draw or show any
+#                      frames while riding. Alternatively the applications "image_collect_train_od.py" or
 #                      "image_collect_test_od.py" can be launched depending on which lines are uncommented in the
 #                      script.
 # * Author:           Joanna Rieger
@@ -31,5 +32,5 @@ export PYTHONPATH=/home/hshl/.local/lib/python3.9/site-packages:$PYTHONPATH
 
 # /usr/bin/python3.9 /home/hshl/smb-safety_system/tools/image_collect_train_od.py >> /home/hshl/startup.log 2>&1
 # /usr/bin/python3.9 /home/hshl/smb-safety_system/tools/image_collect_test_od.py >> /home/hshl/startup.log 2>&1
- /usr/bin/python3.9 /home/hshl/smb-safety_system/src/main.py >> /home/hshl/startup.log 2>&1
+ /usr/bin/python3.9 /home/hshl/smb-safety_system/src/main.py --display headless >> /home/hshl/startup.log 2>&1
 
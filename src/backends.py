@@ -0,0 +1,200 @@
+"""
+py:module::         backends
+
+* Filename:         backends.py
+* Description:      This module contains the inference backends of the object detection. A backend creates the
+                     TensorFlow Lite interpreter the model is run with:
+                        "edgetpu": the "edgetpu.tflite" model on the Coral Edge TPU
+                        "cpu":     the "detect.tflite" model (the same model, not compiled for the Edge TPU) on the
+                                   CPU with "num_threads" threads; TensorFlow Lite uses XNNPACK for it
+                        "stub":    the "StubInterpreter", which returns a car approaching the bicycle without any
+                                   model, for measurements and tests on computers without TensorFlow Lite
+                     "load_backend" creates the interpreter of the requested backend. With "auto" the Edge TPU is
+                     tried first and the CPU is used if the Coral is missing or can not be loaded, so the safety
+                     system keeps working without it, only slower. "measure_speed" runs a few inferences and
+                     returns the time of one inference, which is printed at the start together with the backend.
+* Author:           Joanna Rieger
+* Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
+                      eines rückwärtigen Abstands- und Annäherungswarners"
+* E-Mail:           joanna.rieger@stud.hshl.de
+* Project Sources:
+    * Source:           https://github.com/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi
+    * Source:           https://colab.research.google.com/github/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi/blob/master/Train_TFLite2_Object_Detction_Model.ipynb
+    * Source:           https://pyimagesearch.com/2015/01/19/find-distance-camera-objectmarker-using-python-opencv/
+    * Source:           https://www.welt.de/motor/news/article244937978/Jedes-Jahr-ein-Zentimeter-mehr-Laengenwachstum-bei-Pkw.html#:~:text=Zwischen%202000%20und%202022%20ist,von%20einem%20Zentimeter%20pro%20Jahr.
+    * Source:           https://www.ardalpha.de/wissen/geschichte/kulturgeschichte/din-a4-din-normen-100-jahre-100.html#:~:text=Die%20wohl%20bekannteste%20DIN%2DNorm%20ist%20die%20DIN%20EN%20ISO,noch%20in%20den%20Drucker%20legen.
+    * Source:           https://jashuang1983.wordpress.com/rpi4-ble-with-arduino-nano-33/
+    * Source:           https://docs.arduino.cc/tutorials/nano-33-ble-sense/bluetooth/
+    * Source:           https://github.com/OpenBluetoothToolbox/SimpleBLE/blob/main/examples/simplepyble/write.py
+    * Source:           https://blog.finxter.com/5-best-ways-to-convert-python-csv-to-xml-using-elementtree/
+    * Source:           https://stackoverflow.com/questions/15679467/parse-all-the-xml-files-in-a-directory-one-by-one-using-elementtree
+    * Source:           https://chatgpt.com/
+"""
+
+# ===========================================================================================================
+# ================================================= IMPORTS =================================================
+# ===========================================================================================================
+import os
+import sys
+import time
+from abc import ABC
+from abc import abstractmethod
+import numpy as np
+
+sys.path.append('/home/hshl/smb-safety_system')
+from src import calibration
+
+MODEL_DIR = "/home/hshl/smb-safety_system/config/tensorflow/custom_model_lite/"
+
+
+# ===========================================================================================================
+# ================================================= CLASSES =================================================
+# ===========================================================================================================
+class Backend(ABC):
+    name = None
+    GRAPH_NAME = None
+
+    def __init__(self, model_dir=MODEL_DIR, num_threads=None):
+        self.model_dir = model_dir
+        self.num_threads = num_threads
+
+    @property
+    def model_path(self):
+        return os.path.join(self.model_dir, self.GRAPH_NAME)
+
+    @abstractmethod
+    def create_interpreter(self):
+        pass
+
+
+class EdgeTpuBackend(Backend):
+    name = "edgetpu"
+    GRAPH_NAME = "edgetpu.tflite"
+
+    def create_interpreter(self):
+        # Imported here so that the other backends can be used on computers without TensorFlow Lite.
+        from tflite_runtime.interpreter import Interpreter
+        from tflite_runtime.interpreter import load_delegate
+        return Interpreter(model_path=self.model_path, num_threads=self.num_threads,
+                           experimental_delegates=[load_delegate('libedgetpu.so.1.0')])
+
+
+class CpuBackend(Backend):
+    name = "cpu"
+    GRAPH_NAME = "detect.tflite"
+
+    def __init__(self, model_dir=MODEL_DIR, num_threads=None):
+        super().__init__(model_dir, num_threads if num_threads is not None else os.cpu_count())
+
+    def create_interpreter(self):
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter(model_path=self.model_path, num_threads=self.num_threads)
+
+
+class StubBackend(Backend):
+    name = "stub"
+
+    def __init__(self, model_dir=MODEL_DIR, num_threads=None, invoke_ms=0.0):
+        super().__init__(model_dir, num_threads)
+        self.invoke_ms = invoke_ms
+
+    @property
+    def model_path(self):
+        return None
+
+    def create_interpreter(self):
+        return StubInterpreter(invoke_ms=self.invoke_ms)
+
+
+class StubInterpreter:
+    def __init__(self, input_size=300, num_detections=10, invoke_ms=0.0, start_distance=80.0, end_distance=5.0,
+                 approach_frames=200):
+        self.input_size = input_size
+        self.num_detections = num_detections
+        self.invoke_ms = invoke_ms
+        self.distances = np.linspace(start_distance, end_distance, approach_frames)
+        self.invocations = 0
+        self.input = None
+        self.outputs = None
+
+        registry = calibration.get_registry()
+        # Width of the car as part of the image width, independent of the resolution of the frames.
+        self.relative_width = registry.class_width("full_front_view_car") * registry.focal_length_cal / \
+            registry.calibration_size[0]
+
+    def allocate_tensors(self):
+        self.input = np.zeros((1, self.input_size, self.input_size, 3), dtype=np.uint8)
+        self.outputs = [np.zeros((1, self.num_detections), dtype=np.float32),
+                        np.zeros((1, self.num_detections, 4), dtype=np.float32),
+                        np.zeros((1,), dtype=np.float32),
+                        np.zeros((1, self.num_detections), dtype=np.float32)]
+
+    def get_input_details(self):
+        return [{'index': 0, 'shape': np.array(self.input.shape), 'dtype': np.uint8}]
+
+    def get_output_details(self):
+        return [{'index': index, 'shape': np.array(output.shape), 'dtype': np.float32}
+                for index, output in enumerate(self.outputs)]
+
+    def set_tensor(self, index, value):
+        np.copyto(self.input, value)
+
+    def tensor(self, index):
+        return lambda: self.input
+
+    def invoke(self):
+        if self.invoke_ms > 0:
+            time.sleep(self.invoke_ms / 1000)
+        distance = self.distances[self.invocations % len(self.distances)]
+        self.invocations += 1
+        scores, boxes, count, classes = self.outputs
+        width = min(0.95, self.relative_width / distance)
+        boxes[0, 0] = (0.5 - width / 2, 0.5 - width / 2, 0.5 + width / 2, 0.5 + width / 2)
+        classes[0, 0] = 0
+        scores[0, 0] = 0.9
+        # The remaining detections are below the confidence threshold and have to be filtered by the decoder.
+        boxes[0, 1:] = (0.1, 0.1, 0.2, 0.2)
+        classes[0, 1:] = 2
+        scores[0, 1:] = 0.1
+        count[0] = self.num_detections
+
+    def get_tensor(self, index):
+        # Like TensorFlow Lite, a copy is returned, so it is not changed by the next inference.
+        return self.outputs[index].copy()
+
+
+# ===========================================================================================================
+# ================================================ FUNCTIONS ================================================
+# ===========================================================================================================
+BACKENDS = {backend.name: backend for backend in (EdgeTpuBackend, CpuBackend, StubBackend)}
+
+
+def load_backend(backend="auto", model_dir=MODEL_DIR, num_threads=None):
+    if isinstance(backend, Backend):
+        candidates = [backend]
+    else:
+        names = ["edgetpu", "cpu"] if backend == "auto" else [backend]
+        candidates = [BACKENDS[name](model_dir, num_threads) for name in names]
+    for candidate in candidates:
+        try:
+            interpreter = candidate.create_interpreter()
+            interpreter.allocate_tensors()
+        except (ImportError, ValueError, OSError, RuntimeError) as e:
+            if candidate is candidates[-1]:
+                raise
+            print("Inference backend {} not available: {}".format(candidate.name, e))
+            continue
+        return candidate, interpreter
+
+
+def measure_speed(interpreter, runs=5):
+    input_details = interpreter.get_input_details()[0]
+    input_data = np.zeros(input_details['shape'], dtype=input_details['dtype'])
+    # The first inference loads the model onto the Edge TPU and is not counted.
+    interpreter.set_tensor(input_details['index'], input_data)
+    interpreter.invoke()
+    start = time.perf_counter()
+    for _ in range(runs):
+        interpreter.set_tensor(input_details['index'], input_data)
+        interpreter.invoke()
+    return (time.perf_counter() - start) / runs * 1000
@@ -0,0 +1,117 @@
+"""
+py:module::         calibration
+
+* Filename:         calibration.py
+* Description:      This module contains the "CalibrationRegistry" class. It holds the focal length from the JSON file
+                     produced by "cal_val_DINA4.py" and the widths of the object classes from "main.SizeClasses" for
+                     the whole process, so that the distance calculation does not read any file per detection.
+                     The JSON file is only parsed again if its modification time has changed. The modification time
+                     itself is checked at most once per "check_interval" seconds.
+                     The focal length is given in pixels of the calibration image. If the camera runs with another
+                     resolution, the focal length is scaled by the ratio of the image widths.
+                     "get_registry" returns the registry shared by all modules.
+* Author:           Joanna Rieger
+* Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
+                      eines rückwärtigen Abstands- und Annäherungswarners"
+* E-Mail:           joanna.rieger@stud.hshl.de
+* Project Sources:
+    * Source:           https://github.com/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi
+    * Source:           https://colab.research.google.com/github/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi/blob/master/Train_TFLite2_Object_Detction_Model.ipynb
+    * Source:           https://pyimagesearch.com/2015/01/19/find-distance-camera-objectmarker-using-python-opencv/
+    * Source:           https://www.welt.de/motor/news/article244937978/Jedes-Jahr-ein-Zentimeter-mehr-Laengenwachstum-bei-Pkw.html#:~:text=Zwischen%202000%20und%202022%20ist,von%20einem%20Zentimeter%20pro%20Jahr.
+    * Source:           https://www.ardalpha.de/wissen/geschichte/kulturgeschichte/din-a4-din-normen-100-jahre-100.html#:~:text=Die%20wohl%20bekannteste%20DIN%2DNorm%20ist%20die%20DIN%20EN%20ISO,noch%20in%20den%20Drucker%20legen.
+    * Source:           https://jashuang1983.wordpress.com/rpi4-ble-with-arduino-nano-33/
+    * Source:           https://docs.arduino.cc/tutorials/nano-33-ble-sense/bluetooth/
+    * Source:           https://github.com/OpenBluetoothToolbox/SimpleBLE/blob/main/examples/simplepyble/write.py
+    * Source:           https://blog.finxter.com/5-best-ways-to-convert-python-csv-to-xml-using-elementtree/
+    * Source:           https://stackoverflow.com/questions/15679467/parse-all-the-xml-files-in-a-directory-one-by-one-using-elementtree
+    * Source:           https://chatgpt.com/
+"""
+
+# ===========================================================================================================
+# ================================================= IMPORTS =================================================
+# ===========================================================================================================
+import json
+import os
+import threading
+import time
+import sys
+import cv2
+
+sys.path.append('/home/hshl/smb-safety_system')
+from src import main
+
+
+# ===========================================================================================================
+# ================================================= CLASSES =================================================
+# ===========================================================================================================
+class CalibrationRegistry:
+    def __init__(self, json_path=None, check_interval=1.0):
+        self.json_path = json_path if json_path is not None else main.Paths().json_file_path_DINA4
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.last_check = None
+        self.focal_length_cal = None
+        self.calibration_size = None
+        self.class_to_size = dict(main.SizeClasses().class_to_size)
+
+        self.refresh(force=True)
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and self.last_check is not None and now - self.last_check < self.check_interval:
+            return
+        with self.lock:
+            self.last_check = now
+            mtime = os.stat(self.json_path).st_mtime
+            if mtime != self.mtime:
+                self.load()
+                self.mtime = mtime
+
+    def load(self):
+        with open(self.json_path, "r") as json_file:
+            json_data = json.load(json_file)
+        if "calibration image" not in json_data:
+            return
+        calibration = json_data["calibration image"]
+        self.focal_length_cal = calibration.get("focal length")
+        self.calibration_size = self.get_calibration_size(calibration)
+        print("Calibration loaded: focal length {} for image size {}".format(self.focal_length_cal,
+                                                                           self.calibration_size))
+
+    @staticmethod
+    def get_calibration_size(calibration):
+        if "image width" in calibration and "image height" in calibration:
+            return int(calibration["image width"]), int(calibration["image height"])
+        image_path = calibration.get("image used")
+        if image_path is not None and os.path.exists(image_path):
+            image = cv2.imread(image_path)
+            if image is not None:
+                return image.shape[1], image.shape[0]
+        return None
+
+    def focal_length(self, resolution=None):
+        self.refresh()
+        if self.focal_length_cal is None or resolution is None or self.calibration_size is None:
+            return self.focal_length_cal
+        # The focal length in pixels grows with the image width, as long as the sensor area is not cropped.
+        return self.focal_length_cal * resolution[0] / self.calibration_size[0]
+
+    def class_width(self, class_object):
+        return self.class_to_size[class_object]
+
+
+# ===========================================================================================================
+# ================================================ FUNCTIONS ================================================
+# ===========================================================================================================
+registry = None
+registry_lock = threading.Lock()
+
+
+def get_registry():
+    global registry
+    with registry_lock:
+        if registry is None:
+            registry = CalibrationRegistry()
+        return registry
@@ -4,7 +4,14 @@ py:module::         camera
 * Filename:         camera.py
 * Description:      This module contains two classes "CameraClass" starts the camera and outputs the camera frames
                      without object detection. The "CameraOD" class starts the camera, but does not output the camera
-                     data so that it can still be changed by the object detection before output.
+                     data so that it can still be changed by the object detection before output. "CameraOD" is a
+                     "FrameSource" of the "frame_source" module: its frames are written into a "FrameRing", from
+                     which the object detection reads the latest frame without copying it.
+                     If "model_size" is given, "CameraOD" also lets the image signal processor of the Pi scale the
+                     camera image down to the input size of the model ("lores" stream). The lores stream is YUV420,
+                     the only format it supports on every Raspberry Pi, and is converted to RGB in the camera
+                     thread, which is cheap at this size. It is published together with the full frame, so the
+                     object detection does not have to convert and resize the full frame.
 * Author:           Joanna Rieger
 * Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
                       eines rückwärtigen Abstands- und Annäherungswarners"
@@ -34,6 +41,10 @@ from copy import deepcopy
 from threading import Thread
 import cv2
 from picamera2 import Picamera2
+import sys
+
+sys.path.append('/home/hshl/smb-safety_system')
+from src import frame_source
 
 
 # ===========================================================================================================
@@ -77,20 +88,37 @@ class CameraClass:
         print("Camera stopped")
 
 
-class CameraOD:
-    def __init__(self):
-        self.last_frame = None
-        self.stopped = False
-
+class CameraOD(frame_source.FrameSource):
+    def __init__(self, ring_slots=4, model_size=None):
         self.picam2 = Picamera2()
         self.picam2.preview_configuration.main.format = "RGB888"
+        self.model_size = model_size
+        self.lores_size = None
+        if self.model_size is not None:
+            self.configure_lores()
         self.picam2.start()
         self.config = self.picam2.preview_configuration
-        self.width_picam = self.config.main.size[0]
-        self.height_picam = self.config.main.size[1]
-        self.usable_frame = None
-        self.img_lock = threading.Lock()
-        Thread(target=self.camera).start()
+        if self.model_size is not None:
+            self.lores_size = tuple(self.picam2.camera_configuration()["lores"]["size"])
+            print("Lores stream {} for the model input {}".format(self.lores_size, self.model_size))
+        super().__init__(self.config.main.size[0], self.config.main.size[1], ring_slots)
+        self.start()
+
+    def configure_lores(self):
+        try:
+            self.picam2.preview_configuration.enable_lores()
+            self.picam2.preview_configuration.lores.size = tuple(int(size) for size in self.model_size)
+            self.picam2.preview_configuration.lores.format = "YUV420"
+        except Exception as e:
+            print("Lores stream not available, the frames are resized for the model: {}".format(e))
+            self.model_size = None
+
+    def lores_to_rgb(self, lores):
+        # The rows of the YUV420 array can be longer than the image because of the alignment of the ISP.
+        rgb = cv2.cvtColor(lores, cv2.COLOR_YUV420p2RGB)[:, :self.lores_size[0]]
+        if self.lores_size != tuple(self.model_size):
+            rgb = cv2.resize(rgb, tuple(self.model_size))
+        return rgb
 
     def camera(self):
         print("Funktion to read camera images for Object Detection started!")
@@ -99,14 +127,11 @@ class CameraOD:
             if self.stopped:
                 print("stop")
                 self.picam2.stop()
+                self.frames.stop()
                 return
-            self.last_frame = self.picam2.capture_array()
-            self.usable_frame = self.get_image()
-
-    def get_image(self):
-        with self.img_lock:
-            return deepcopy(self.last_frame)
-
-    def stop_camera(self):
-        self.stopped = True
-        print("Camera stopped")
+            if self.model_size is None:
+                self.last_frame = self.picam2.capture_array()
+                self.frames.publish(self.last_frame)
+                continue
+            (self.last_frame, lores), _ = self.picam2.capture_arrays(["main", "lores"])
+            self.frames.publish(self.last_frame, side=self.lores_to_rgb(lores))
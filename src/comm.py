@@ -6,6 +6,27 @@ py:module::         comm
                      handles the setup and the BLE connection with the Arduino. "rpi_connection_check" can be used to
                      check whether there is a connection with the Arduino. The data is sent in the "rpi_send_data"
                      function.
+                     The "ActuationWorker" class owns the connected Arduino during the object detection. It takes the
+                     LED colors from a queue and writes them in its own thread, so the object detection never waits
+                     for BLE. Colors queued in a burst are combined to the latest one, and a color that has already
+                     been sent is only sent again as a keepalive. If the characteristic supports it, the worker uses
+                     write-without-response.
+                     The "ConnectionSupervisor" class watches the connection to the Arduino in a background thread and
+                     reconnects with an increasing waiting time (backoff) if it is lost. The object detection only
+                     calls the non-blocking "is_ready" and "send" functions, so a lost connection never stops the
+                     detection. The function used to connect can be replaced, e.g. by one returning a fake peripheral
+                     for testing. As the supervisor starts without a connection, the object detection can start while
+                     the Arduino is still searched; "on_connect" is called with every new connection. The time from
+                     a lost connection until the next connection is recorded as reconnect latency.
+                     The "ArduinoConnector" class is the fast way to connect. It keeps the peripheral handle of the
+                     Arduino and first connects to it directly with a short timeout. After a restart of the program
+                     the handle is looked up in the peripherals known to the adapter by the last address that worked,
+                     which the "PeripheralCache" keeps in a small JSON file. Only if this fails, the Arduino is
+                     searched with a scan, which stops as soon as the Arduino is found and takes at most 2 seconds
+                     like before. A direct connection that is given up is disconnected; as long as its thread still
+                     runs, no scan is started, so two connections to the same Arduino are never made. If the first
+                     write after a connection fails, the Arduino is disconnected again. "rpi_comm_setup" uses a
+                     connector without a file.
 * Author:           Joanna Rieger
 * Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
                       eines rückwärtigen Abstands- und Annäherungswarners"
@@ -27,40 +48,363 @@ py:module::         comm
 # ===========================================================================================================
 # ================================================= IMPORTS =================================================
 # ===========================================================================================================
-import simplepyble
+import json
+import os
+import queue
 import sys
+import threading
+import time
+from threading import Thread
 
 sys.path.append('/home/hshl/smb-safety_system')
+from src import metrics
 
 mac_address = "45:99:72:43:F3:24"
 SERVICE_UUID = "12345678-1234-5678-1234-56789abcdef0"
 CHARACTERISTIC_UUID = "12345678-1234-5678-1234-56789abcdef1"
+LED_TO_INT = {"red": 1, "yellow": 2, "green": 3}
+# Buckets in seconds for connecting to the Arduino, which takes much longer than a write.
+CONNECT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+
+BLE_WRITES = metrics.registry.counter("ble_writes_total", "LED values written to the Arduino")
+BLE_WRITES_SKIPPED = metrics.registry.counter("ble_writes_skipped_total",
+                                              "LED values not written because the LEDs already show them")
+BLE_WRITE_FAILURES = metrics.registry.counter("ble_write_failures_total", "Failed writes to the Arduino")
+BLE_WRITE_SECONDS = metrics.registry.histogram("ble_write_seconds", "Duration of a write to the Arduino")
+BLE_RECONNECTS = metrics.registry.counter("ble_reconnects_total", "Connections to the Arduino made while running")
+BLE_CONNECTED = metrics.registry.gauge("ble_connected", "1 if the Arduino is connected, else 0")
+BLE_CONNECT_SECONDS = metrics.registry.histogram("ble_connect_seconds", "Duration of a successful connection attempt",
+                                                 CONNECT_BUCKETS)
+BLE_CONNECTS_DIRECT = metrics.registry.counter("ble_connects_direct_total",
+                                               "Connections made directly with the cached peripheral, without a scan")
+BLE_CONNECTS_SCAN = metrics.registry.counter("ble_connects_scan_total", "Connections for which a scan was needed")
+BLE_RECONNECT_SECONDS = metrics.registry.histogram("ble_reconnect_seconds",
+                                                   "Time from a lost connection until the Arduino is connected again",
+                                                   CONNECT_BUCKETS)
+
+
+# ===========================================================================================================
+# ================================================= CLASSES =================================================
+# ===========================================================================================================
+class ActuationWorker:
+    def __init__(self, arduino=None, keepalive=2.0):
+        self.arduino = None
+        self.write_command = False
+        self.keepalive = keepalive
+        self.commands = queue.Queue()
+        self.last_requested = None
+        self.last_sent = None
+        self.last_sent_time = 0.0
+        self.writes = 0
+        self.skipped = 0
+        self.failures = 0
+        self.stopped = False
+
+        self.attach(arduino)
+        Thread(target=self.run, daemon=True).start()
+
+    def attach(self, arduino):
+        self.arduino = arduino
+        self.write_command = arduino is not None and supports_write_command(arduino)
+        self.last_sent = None
+        if arduino is not None and self.last_requested is not None:
+            self.commands.put(self.last_requested)
+
+    def send(self, led):
+        self.commands.put(led)
+        return led
+
+    def run(self):
+        while not self.stopped:
+            try:
+                led = self.commands.get(timeout=self.keepalive)
+            except queue.Empty:
+                led = self.last_requested
+            while True:
+                try:
+                    led = self.commands.get_nowait()
+                except queue.Empty:
+                    break
+            if led is None:
+                continue
+            self.last_requested = led
+            now = time.monotonic()
+            if led == self.last_sent and (now - self.last_sent_time) < self.keepalive:
+                self.skipped += 1
+                BLE_WRITES_SKIPPED.inc()
+                continue
+            self.write(led, now)
+
+    def write(self, led, now):
+        arduino = self.arduino
+        if arduino is None:
+            return
+        data = bytes([led_to_int(led)])
+        try:
+            if self.write_command:
+                arduino.write_command(SERVICE_UUID, CHARACTERISTIC_UUID, data)
+            else:
+                arduino.write_request(SERVICE_UUID, CHARACTERISTIC_UUID, data)
+            self.last_sent = led
+            self.last_sent_time = now
+            self.writes += 1
+            BLE_WRITES.inc()
+            BLE_WRITE_SECONDS.observe(time.monotonic() - now)
+        except Exception:
+            self.failures += 1
+            BLE_WRITE_FAILURES.inc()
+            print("Failed to write to Arduino!")
+
+    def stop(self):
+        self.stopped = True
+
+
+class ConnectionSupervisor:
+    def __init__(self, arduino=None, connect=None, check_interval=1.0, backoff_min=0.5, backoff_max=30.0,
+                 actuator=None, on_connect=None):
+        self.connect = connect if connect is not None else rpi_comm_setup
+        self.check_interval = check_interval
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.actuator = actuator if actuator is not None else ActuationWorker()
+        self.on_connect = on_connect
+        self.state = "disconnected"
+        self.reconnects = 0
+        self.last_reconnect_seconds = None
+        self.stopped = False
+        self.wakeup = threading.Event()
+
+        if is_connected(arduino):
+            self.actuator.attach(arduino)
+            self.state = "connected"
+            if self.on_connect is not None:
+                self.on_connect(arduino)
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    @property
+    def arduino(self):
+        return self.actuator.arduino
+
+    def run(self):
+        backoff = self.backoff_min
+        lost_time = time.monotonic()
+        while not self.stopped:
+            if is_connected(self.actuator.arduino):
+                self.state = "connected"
+                BLE_CONNECTED.set(1)
+                backoff = self.backoff_min
+                self.wakeup.wait(self.check_interval)
+                continue
+            if self.actuator.arduino is not None:
+                print("Connection to Arduino lost!")
+                self.actuator.attach(None)
+                lost_time = time.monotonic()
+            BLE_CONNECTED.set(0)
+
+            self.state = "connecting"
+            try:
+                arduino = self.connect()
+            except Exception as e:
+                print("Connecting to Arduino failed: {}".format(e))
+                arduino = None
+            if is_connected(arduino):
+                self.actuator.attach(arduino)
+                self.reconnects += 1
+                BLE_RECONNECTS.inc()
+                self.state = "connected"
+                self.last_reconnect_seconds = time.monotonic() - lost_time
+                BLE_RECONNECT_SECONDS.observe(self.last_reconnect_seconds)
+                print("Connected to Arduino after {:.2f} s".format(self.last_reconnect_seconds))
+                if self.on_connect is not None:
+                    self.on_connect(arduino)
+                continue
+            self.state = "disconnected"
+            self.wakeup.wait(backoff)
+            backoff = min(backoff * 2, self.backoff_max)
+
+    def is_ready(self):
+        return self.state == "connected"
+
+    def send(self, led):
+        return self.actuator.send(led)
+
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+        self.actuator.stop()
+
+
+class PeripheralCache:
+    def __init__(self, path=None, address=mac_address):
+        self.path = path
+        self.address = address
+        self.identifier = None
+        self.peripheral = None
+        self.load()
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as cache_file:
+                cached = json.load(cache_file)
+            self.address = cached.get("address", self.address)
+            self.identifier = cached.get("identifier")
+        except (OSError, ValueError) as e:
+            print("BLE cache {} can not be read: {}".format(self.path, e))
+
+    def store(self, peripheral):
+        self.peripheral = peripheral
+        self.address = peripheral.address()
+        self.identifier = peripheral.identifier()
+        if self.path is None:
+            return
+        # The file is replaced in one step, so a crash while writing never leaves a broken cache.
+        tmp_path = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, "w") as cache_file:
+                json.dump({"address": self.address, "identifier": self.identifier,
+                           "connected": time.strftime("%Y-%m-%d %H:%M:%S")}, cache_file)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print("BLE cache {} can not be written: {}".format(self.path, e))
+
+    def addresses(self):
+        return [self.address] if self.address == mac_address else [self.address, mac_address]
+
+
+class ArduinoConnector:
+    def __init__(self, cache=None, direct_timeout=2.0, scan_timeout=2.0):
+        self.cache = cache if cache is not None else PeripheralCache()
+        self.direct_timeout = direct_timeout
+        self.scan_timeout = scan_timeout
+        self.adapter = None
+        self.last_connect = None
+        self.pending = None
+
+    def __call__(self):
+        if self.pending is not None:
+            if self.pending.is_alive():
+                print("Given up direct connection to Arduino [{}] still running".format(self.cache.address))
+                return None
+            self.pending = None
+        start = time.monotonic()
+        method = "direct"
+        arduino = self.connect_direct()
+        if arduino is None and self.pending is None:
+            method = "scan"
+            arduino = self.connect_scan()
+        if arduino is None:
+            return None
+        try:
+            arduino.write_request(SERVICE_UUID, CHARACTERISTIC_UUID, bytes([3]))
+        except Exception as e:
+            print("Writing to Arduino after the {} connection failed: {}".format(method, e))
+            self.cache.peripheral = None
+            try:
+                arduino.disconnect()
+            except Exception:
+                pass
+            return None
+        self.cache.store(arduino)
+        seconds = time.monotonic() - start
+        self.last_connect = {"method": method, "seconds": seconds, "address": self.cache.address}
+        BLE_CONNECT_SECONDS.observe(seconds)
+        (BLE_CONNECTS_DIRECT if method == "direct" else BLE_CONNECTS_SCAN).inc()
+        print("Arduino [{}] connected {} in {:.2f} s".format(self.cache.address, method, seconds))
+        return arduino
+
+    def get_adapter(self):
+        if self.adapter is None:
+            # Imported here so that the rest of the module can be used without the Bluetooth library.
+            import simplepyble
+            self.adapter = simplepyble.Adapter.get_adapters()[0]
+        return self.adapter
+
+    def known_peripheral(self):
+        if self.cache.peripheral is not None:
+            return self.cache.peripheral
+        # Peripherals the adapter already knows (e.g. from the last run) can be connected without a scan, if the
+        # installed SimpleBLE supports it.
+        try:
+            for peripheral in self.get_adapter().get_paired_peripherals():
+                if peripheral.address() in self.cache.addresses():
+                    return peripheral
+        except Exception:
+            pass
+        return None
+
+    def connect_direct(self):
+        peripheral = self.known_peripheral()
+        if peripheral is None:
+            return None
+        errors = []
+        abandoned = threading.Event()
+
+        def connect():
+            try:
+                peripheral.connect()
+                # Given up while connecting: the connection that was made after all is not used.
+                if abandoned.is_set():
+                    peripheral.disconnect()
+            except Exception as e:
+                errors.append(e)
+
+        # "connect" has no timeout of its own, so it runs in a thread that is given up after the timeout.
+        thread = Thread(target=connect, daemon=True)
+        thread.start()
+        thread.join(self.direct_timeout)
+        if thread.is_alive() or errors or not is_connected(peripheral):
+            print("Direct connection to Arduino [{}] failed".format(self.cache.address))
+            self.cache.peripheral = None
+            abandoned.set()
+            try:
+                peripheral.disconnect()
+            except Exception:
+                pass
+            # A scan is only started once "connect" returned, otherwise it could connect to the same Arduino.
+            thread.join(self.direct_timeout)
+            if thread.is_alive():
+                self.pending = thread
+            return None
+        return peripheral
+
+    def connect_scan(self):
+        print("RPi Bluetooth setup")
+        print("Connecting…")
+        adapter = self.get_adapter()
+        addresses = self.cache.addresses()
+        found = []
+        found_event = threading.Event()
+
+        def on_found(peripheral):
+            print(f"Found {peripheral.identifier()} [{peripheral.address()}]")
+            if peripheral.address() in addresses and not found:
+                found.append(peripheral)
+                found_event.set()
+
+        adapter.set_callback_on_scan_start(lambda: print("Scan started."))
+        adapter.set_callback_on_scan_stop(lambda: print("Scan complete."))
+        adapter.set_callback_on_scan_found(on_found)
+        # The scan stops as soon as the Arduino is found instead of always taking the full time.
+        adapter.scan_start()
+        found_event.wait(self.scan_timeout)
+        adapter.scan_stop()
+        if not found:
+            print(f"Arduino with Mac-Address {mac_address} not found!")
+            return None
+        arduino = found[0]
+        arduino.connect()
+        return arduino
 
 
 # ===========================================================================================================
 # ================================================ FUNCTIONS ================================================
 # ===========================================================================================================
-def rpi_comm_setup():
-    print("RPi Bluetooth setup")
-    print("Connecting…")
-    adapter = simplepyble.Adapter.get_adapters()[0]
-    adapter.set_callback_on_scan_start(lambda: print("Scan started."))
-    adapter.set_callback_on_scan_stop(lambda: print("Scan complete."))
-    adapter.set_callback_on_scan_found(
-        lambda peripheral: print(f"Found {peripheral.identifier()} [{peripheral.address()}]"))
-
-    adapter.scan_for(2000)
-    peripherals = adapter.scan_get_results()
-    for peripheral in peripherals:
-        if peripheral.address() == mac_address:
-            arduino = peripheral
-            break
-    else:
-        print(f"Arduino with Mac-Address {mac_address} not found!")
-        return
-    arduino.connect()
-    arduino.write_request(SERVICE_UUID, CHARACTERISTIC_UUID, bytes([3]))
-    return arduino
+def rpi_comm_setup(connector=None):
+    return (connector if connector is not None else default_connector)()
 
 
 def rpi_connection_check(arduino):
@@ -78,16 +422,42 @@ def rpi_connection_check(arduino):
 
 
 def rpi_send_data(led, arduino):
-    if led == "red":
-        led_int = 1
-    elif led == "yellow":
-        led_int = 2
-    elif led == "green":
-        led_int = 3
-    else:
-        led_int = 0
+    if isinstance(arduino, (ActuationWorker, ConnectionSupervisor)):
+        return arduino.send(led)
+    led_int = led_to_int(led)
     try:
         arduino.write_request(SERVICE_UUID, CHARACTERISTIC_UUID, bytes([led_int]))
+        BLE_WRITES.inc()
     except:
+        BLE_WRITE_FAILURES.inc()
         print("Failed to write to Arduino!")
     return led
+
+
+def led_to_int(led):
+    return LED_TO_INT.get(led, 0)
+
+
+def supports_write_command(arduino):
+    try:
+        for service in arduino.services():
+            if service.uuid() != SERVICE_UUID:
+                continue
+            for characteristic in service.characteristics():
+                if characteristic.uuid() == CHARACTERISTIC_UUID:
+                    return "write_command" in characteristic.capabilities()
+    except Exception:
+        pass
+    return False
+
+
+def is_connected(arduino):
+    if arduino is None:
+        return False
+    try:
+        return arduino.is_connected()
+    except Exception:
+        return False
+
+
+default_connector = ArduinoConnector()
@@ -0,0 +1,96 @@
+"""
+py:module::         decoding
+
+* Filename:         decoding.py
+* Description:      This module contains the "DetectionDecoder" class. It turns the raw output tensors of the object
+                     detection model (boxes, classes and scores) into a structured NumPy array in one vectorized
+                     pass. Every row of the array holds the bounding box in pixels, the class id, the score, the width
+                     of the bounding box and the calculated distance of one detection above the confidence
+                     threshold. The real widths of the classes are stored in an array indexed by the class id, so no
+                     dictionary lookup is needed per detection.
+                     If the model was run on a part of the frame ("region", see the "regions" module), the boxes
+                     are mapped back into the full frame before the width and the distance are calculated.
+                     The decoder is used by the object detection on the bicycle as well as by the offline tools.
+* Author:           Joanna Rieger
+* Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
+                      eines rückwärtigen Abstands- und Annäherungswarners"
+* E-Mail:           joanna.rieger@stud.hshl.de
+* Project Sources:
+    * Source:           https://github.com/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi
+    * Source:           https://colab.research.google.com/github/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi/blob/master/Train_TFLite2_Object_Detction_Model.ipynb
+    * Source:           https://pyimagesearch.com/2015/01/19/find-distance-camera-objectmarker-using-python-opencv/
+    * Source:           https://www.welt.de/motor/news/article244937978/Jedes-Jahr-ein-Zentimeter-mehr-Laengenwachstum-bei-Pkw.html#:~:text=Zwischen%202000%20und%202022%20ist,von%20einem%20Zentimeter%20pro%20Jahr.
+    * Source:           https://www.ardalpha.de/wissen/geschichte/kulturgeschichte/din-a4-din-normen-100-jahre-100.html#:~:text=Die%20wohl%20bekannteste%20DIN%2DNorm%20ist%20die%20DIN%20EN%20ISO,noch%20in%20den%20Drucker%20legen.
+    * Source:           https://jashuang1983.wordpress.com/rpi4-ble-with-arduino-nano-33/
+    * Source:           https://docs.arduino.cc/tutorials/nano-33-ble-sense/bluetooth/
+    * Source:           https://github.com/OpenBluetoothToolbox/SimpleBLE/blob/main/examples/simplepyble/write.py
+    * Source:           https://blog.finxter.com/5-best-ways-to-convert-python-csv-to-xml-using-elementtree/
+    * Source:           https://stackoverflow.com/questions/15679467/parse-all-the-xml-files-in-a-directory-one-by-one-using-elementtree
+    * Source:           https://chatgpt.com/
+"""
+
+# ===========================================================================================================
+# ================================================= IMPORTS =================================================
+# ===========================================================================================================
+import sys
+import numpy as np
+
+sys.path.append('/home/hshl/smb-safety_system')
+from src import calibration
+
+DETECTION_DTYPE = np.dtype([("xmin", np.int32),
+                            ("ymin", np.int32),
+                            ("xmax", np.int32),
+                            ("ymax", np.int32),
+                            ("class_id", np.int32),
+                            ("score", np.float32),
+                            ("width", np.int32),
+                            ("distance", np.float64)])
+
+
+# ===========================================================================================================
+# ================================================= CLASSES =================================================
+# ===========================================================================================================
+class DetectionDecoder:
+    def __init__(self, labels, im_w, im_h, min_conf_threshold=0.5, registry=None):
+        self.labels = labels
+        self.imW = im_w
+        self.imH = im_h
+        self.min_conf_threshold = min_conf_threshold
+        self.registry = registry if registry is not None else calibration.get_registry()
+        self.class_widths = np.array([self.registry.class_to_size.get(label, np.nan) for label in labels],
+                                     dtype=np.float64)
+
+    def decode(self, boxes, classes, scores, focal_length=None, min_conf_threshold=None, region=None):
+        if min_conf_threshold is None:
+            min_conf_threshold = self.min_conf_threshold
+        if focal_length is None:
+            focal_length = self.registry.focal_length((self.imW, self.imH))
+
+        scores = np.asarray(scores)
+        keep = np.flatnonzero((scores > min_conf_threshold) & (scores <= 1.0))
+        detections = np.empty(len(keep), dtype=DETECTION_DTYPE)
+        if len(keep) == 0:
+            return detections
+
+        x, y, w, h = (0, 0, self.imW, self.imH) if region is None else region
+        kept_boxes = np.asarray(boxes)[keep]
+        detections["ymin"] = np.maximum(1, y + kept_boxes[:, 0] * h)
+        detections["xmin"] = np.maximum(1, x + kept_boxes[:, 1] * w)
+        detections["ymax"] = np.minimum(self.imH, y + kept_boxes[:, 2] * h)
+        detections["xmax"] = np.minimum(self.imW, x + kept_boxes[:, 3] * w)
+        detections["class_id"] = np.asarray(classes)[keep]
+        detections["score"] = scores[keep]
+        detections["width"] = detections["xmax"] - detections["xmin"]
+        detections["distance"] = self.distances(detections["width"], detections["class_id"], focal_length)
+        return detections
+
+    def distances(self, widths, class_ids, focal_length):
+        widths = np.asarray(widths, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            distances = self.class_widths[class_ids] * focal_length / widths
+        distances[widths <= 0] = np.inf
+        return distances
+
+    def label(self, class_id):
+        return self.labels[int(class_id)]
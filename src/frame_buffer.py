@@ -0,0 +1,124 @@
+"""
+py:module::         frame_buffer
+
+* Filename:         frame_buffer.py
+* Description:      This module contains the "FrameRing" class. It is a fixed ring of preallocated frame slots that
+                     is filled by the camera thread. Every frame that is written into the ring gets a monotonically
+                     increasing sequence number and the time it was captured. Consumers call "get_latest" with the
+                     sequence number of the last frame they processed and block until a newer frame is available.
+                     The frame is handed out as a read-only view of its slot, so no copy is made for the consumer.
+                     Sources that must not lose frames (e.g. recorded files) can call "wait_for_reader" to wait until
+                     the consumer has taken the previous frames. Other readers, like the recorder, call
+                     "get_latest" with "acknowledge=False", so they do not count as this consumer.
+                     A consumer that needs a frame after it has taken the next one (e.g. to draw or save it after
+                     the inference) has to use "copy_frame": the slot can be overwritten at any time, so the copy is
+                     only returned if the slot was still valid after copying, otherwise None.
+                     Together with every frame a second, smaller image can be published (e.g. the low resolution
+                     stream of the camera), which is read with "get_side" for the sequence number of the frame.
+* Author:           Joanna Rieger
+* Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
+                      eines rückwärtigen Abstands- und Annäherungswarners"
+* E-Mail:           joanna.rieger@stud.hshl.de
+* Project Sources:
+    * Source:           https://github.com/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi
+    * Source:           https://colab.research.google.com/github/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi/blob/master/Train_TFLite2_Object_Detction_Model.ipynb
+    * Source:           https://pyimagesearch.com/2015/01/19/find-distance-camera-objectmarker-using-python-opencv/
+    * Source:           https://www.welt.de/motor/news/article244937978/Jedes-Jahr-ein-Zentimeter-mehr-Laengenwachstum-bei-Pkw.html#:~:text=Zwischen%202000%20und%202022%20ist,von%20einem%20Zentimeter%20pro%20Jahr.
+    * Source:           https://www.ardalpha.de/wissen/geschichte/kulturgeschichte/din-a4-din-normen-100-jahre-100.html#:~:text=Die%20wohl%20bekannteste%20DIN%2DNorm%20ist%20die%20DIN%20EN%20ISO,noch%20in%20den%20Drucker%20legen.
+    * Source:           https://jashuang1983.wordpress.com/rpi4-ble-with-arduino-nano-33/
+    * Source:           https://docs.arduino.cc/tutorials/nano-33-ble-sense/bluetooth/
+    * Source:           https://github.com/OpenBluetoothToolbox/SimpleBLE/blob/main/examples/simplepyble/write.py
+    * Source:           https://blog.finxter.com/5-best-ways-to-convert-python-csv-to-xml-using-elementtree/
+    * Source:           https://stackoverflow.com/questions/15679467/parse-all-the-xml-files-in-a-directory-one-by-one-using-elementtree
+    * Source:           https://chatgpt.com/
+"""
+
+# ===========================================================================================================
+# ================================================= IMPORTS =================================================
+# ===========================================================================================================
+import threading
+import time
+import numpy as np
+
+
+# ===========================================================================================================
+# ================================================= CLASSES =================================================
+# ===========================================================================================================
+class FrameRing:
+    def __init__(self, slots=4, shape=None, dtype=np.uint8):
+        self.slots = slots
+        self.dtype = dtype
+        self.buffer = None
+        self.side_buffer = None
+        self.seq = -1
+        self.read_seq = -1
+        self.timestamps = [0.0] * self.slots
+        self.stopped = False
+        self.cond = threading.Condition()
+
+        if shape is not None:
+            self.allocate(shape)
+
+    def allocate(self, shape):
+        self.buffer = np.empty((self.slots,) + tuple(shape), dtype=self.dtype)
+
+    def publish(self, frame, timestamp=None, side=None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+        if self.buffer is None or self.buffer.shape[1:] != frame.shape:
+            self.allocate(frame.shape)
+        # The slot is filled outside the lock: it is the oldest one and only readers that fell a full ring behind
+        # can still hold it, which "is_valid" reports to them.
+        slot = (self.seq + 1) % self.slots
+        np.copyto(self.buffer[slot], frame)
+        if side is not None:
+            if self.side_buffer is None or self.side_buffer.shape[1:] != side.shape:
+                self.side_buffer = np.empty((self.slots,) + side.shape, dtype=side.dtype)
+            np.copyto(self.side_buffer[slot], side)
+        with self.cond:
+            self.seq += 1
+            self.timestamps[slot] = timestamp
+            self.cond.notify_all()
+        return self.seq
+
+    def get_latest(self, after_seq=-1, timeout=None, acknowledge=True):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > after_seq or self.stopped, timeout):
+                return None
+            if self.seq <= after_seq:
+                return None
+            seq = self.seq
+            slot = seq % self.slots
+            timestamp = self.timestamps[slot]
+            if acknowledge and seq > self.read_seq:
+                self.read_seq = seq
+                self.cond.notify_all()
+        view = self.buffer[slot]
+        view.flags.writeable = False
+        return seq, timestamp, view
+
+    def get_side(self, seq):
+        if self.side_buffer is None or not self.is_valid(seq):
+            return None
+        view = self.side_buffer[seq % self.slots]
+        view.flags.writeable = False
+        return view
+
+    def copy_frame(self, seq, frame):
+        # Frames of the ring are read-only views of their slot; a writeable frame is already a private copy.
+        if frame.flags.writeable:
+            return frame
+        copy = frame.copy()
+        return copy if self.is_valid(seq) else None
+
+    def wait_for_reader(self, max_ahead=1, timeout=None):
+        with self.cond:
+            return self.cond.wait_for(lambda: self.seq - self.read_seq < max_ahead or self.stopped, timeout)
+
+    def is_valid(self, seq):
+        return seq >= 0 and self.seq - seq < self.slots - 1
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
@@ -0,0 +1,214 @@
+"""
+py:module::         frame_source
+
+* Filename:         frame_source.py
+* Description:      This module contains the interface for the sources of camera frames used by the object detection.
+                     A "FrameSource" reads frames in its own thread and writes them into a "FrameRing", from which the
+                     object detection takes the latest frame with "get_latest". "CameraOD" of the "camera" module is
+                     the frame source on the bicycle.
+                     The file-backed sources make it possible to run and measure the object detection on any Linux
+                     computer without a Raspberry Pi camera:
+                        "VideoFileSource": reads a video file, e.g. a recorded ride
+                        "ImageDirSource":  reads the JPEG images of a directory in alphabetical order
+                        "RawDumpSource":   reads a NumPy file with the shape (frames, height, width, 3); if a file
+                                           "<name>_timestamps.npy" exists, it holds the capture time of every frame
+                     With "realtime" the frames are delivered with the timing they were recorded with, like a camera,
+                     and frames the object detection is too slow for are skipped. Without "realtime" the frames are
+                     delivered as fast as the object detection takes them and no frame is skipped. The thread of a
+                     file-backed source is a daemon and checks "stopped" while it waits, so it never keeps the
+                     program alive after the object detection ended.
+                     "open_source" selects the right source for a path.
+                     "get_model_input" returns the low resolution image published together with a frame, if the
+                     source has one (see "CameraOD"), the recorded sources have none.
+* Author:           Joanna Rieger
+* Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
+                      eines rückwärtigen Abstands- und Annäherungswarners"
+* E-Mail:           joanna.rieger@stud.hshl.de
+* Project Sources:
+    * Source:           https://github.com/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi
+    * Source:           https://colab.research.google.com/github/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi/blob/master/Train_TFLite2_Object_Detction_Model.ipynb
+    * Source:           https://pyimagesearch.com/2015/01/19/find-distance-camera-objectmarker-using-python-opencv/
+    * Source:           https://www.welt.de/motor/news/article244937978/Jedes-Jahr-ein-Zentimeter-mehr-Laengenwachstum-bei-Pkw.html#:~:text=Zwischen%202000%20und%202022%20ist,von%20einem%20Zentimeter%20pro%20Jahr.
+    * Source:           https://www.ardalpha.de/wissen/geschichte/kulturgeschichte/din-a4-din-normen-100-jahre-100.html#:~:text=Die%20wohl%20bekannteste%20DIN%2DNorm%20ist%20die%20DIN%20EN%20ISO,noch%20in%20den%20Drucker%20legen.
+    * Source:           https://jashuang1983.wordpress.com/rpi4-ble-with-arduino-nano-33/
+    * Source:           https://docs.arduino.cc/tutorials/nano-33-ble-sense/bluetooth/
+    * Source:           https://github.com/OpenBluetoothToolbox/SimpleBLE/blob/main/examples/simplepyble/write.py
+    * Source:           https://blog.finxter.com/5-best-ways-to-convert-python-csv-to-xml-using-elementtree/
+    * Source:           https://stackoverflow.com/questions/15679467/parse-all-the-xml-files-in-a-directory-one-by-one-using-elementtree
+    * Source:           https://chatgpt.com/
+"""
+
+# ===========================================================================================================
+# ================================================= IMPORTS =================================================
+# ===========================================================================================================
+import os
+import sys
+import time
+from abc import ABC
+from abc import abstractmethod
+from threading import Thread
+import cv2
+import numpy as np
+
+sys.path.append('/home/hshl/smb-safety_system')
+from src import frame_buffer
+
+
+# ===========================================================================================================
+# ================================================= CLASSES =================================================
+# ===========================================================================================================
+class FrameSource(ABC):
+    def __init__(self, width, height, ring_slots=4):
+        self.last_frame = None
+        self.stopped = False
+        self.width_picam = width
+        self.height_picam = height
+        self.frames = frame_buffer.FrameRing(ring_slots, (self.height_picam, self.width_picam, 3))
+
+    def start(self):
+        Thread(target=self.camera).start()
+
+    @abstractmethod
+    def camera(self):
+        pass
+
+    def get_latest(self, after_seq=-1, timeout=None):
+        return self.frames.get_latest(after_seq, timeout)
+
+    def get_model_input(self, frame_seq):
+        return self.frames.get_side(frame_seq)
+
+    def get_image(self):
+        latest = self.frames.get_latest(timeout=0, acknowledge=False)
+        if latest is None:
+            return None
+        return latest[2].copy()
+
+    def stop_camera(self):
+        self.stopped = True
+        print("Camera stopped")
+
+
+class FileFrameSource(FrameSource):
+    def __init__(self, width, height, ring_slots=4, realtime=False, fps=30.0, loop=False):
+        super().__init__(width, height, ring_slots)
+        self.realtime = realtime
+        self.fps = fps
+        self.loop = loop
+        self.frames_read = 0
+
+    def start(self):
+        Thread(target=self.camera, daemon=True).start()
+
+    @abstractmethod
+    def read_frames(self):
+        pass
+
+    def camera(self):
+        print("Funktion to read frames from {} started!".format(type(self).__name__))
+        start_wall = None
+        start_source = None
+        while not self.stopped:
+            for frame, source_time in self.read_frames():
+                if self.stopped:
+                    break
+                if self.realtime:
+                    if start_wall is None:
+                        start_wall = time.monotonic()
+                        start_source = source_time
+                    time.sleep(max(0.0, (source_time - start_source) - (time.monotonic() - start_wall)))
+                else:
+                    while not self.frames.wait_for_reader(timeout=0.5) and not self.stopped:
+                        pass
+                    if self.stopped:
+                        break
+                self.last_frame = frame
+                self.frames.publish(frame)
+                self.frames_read += 1
+            if not self.loop:
+                break
+            start_wall = None
+        print("Frame source finished after {} frames".format(self.frames_read))
+        self.stopped = True
+        self.frames.stop()
+
+    def stop_camera(self):
+        super().stop_camera()
+        self.frames.stop()
+
+
+class VideoFileSource(FileFrameSource):
+    def __init__(self, path, ring_slots=4, realtime=False, loop=False):
+        self.path = path
+        capture = cv2.VideoCapture(self.path)
+        if not capture.isOpened():
+            raise IOError("Video {} can not be opened".format(self.path))
+        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        capture.release()
+        super().__init__(width, height, ring_slots, realtime, fps, loop)
+        self.start()
+
+    def read_frames(self):
+        capture = cv2.VideoCapture(self.path)
+        index = 0
+        try:
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    return
+                yield frame, index / self.fps
+                index += 1
+        finally:
+            capture.release()
+
+
+class ImageDirSource(FileFrameSource):
+    def __init__(self, path, ring_slots=4, realtime=False, fps=10.0, loop=False):
+        self.path = path
+        self.file_names = sorted(file for file in os.listdir(self.path) if file.lower().endswith((".jpg", ".jpeg")))
+        if not self.file_names:
+            raise IOError("No JPEG images in {}".format(self.path))
+        first = cv2.imread(os.path.join(self.path, self.file_names[0]))
+        super().__init__(first.shape[1], first.shape[0], ring_slots, realtime, fps, loop)
+        self.start()
+
+    def read_frames(self):
+        for index, file_name in enumerate(self.file_names):
+            frame = cv2.imread(os.path.join(self.path, file_name))
+            if frame is None:
+                print("Image {} can not be read".format(file_name))
+                continue
+            if frame.shape[:2] != (self.height_picam, self.width_picam):
+                frame = cv2.resize(frame, (self.width_picam, self.height_picam))
+            yield frame, index / self.fps
+
+
+class RawDumpSource(FileFrameSource):
+    def __init__(self, path, ring_slots=4, realtime=False, fps=30.0, loop=False):
+        self.path = path
+        self.dump = np.load(self.path, mmap_mode="r")
+        timestamps_path = os.path.splitext(self.path)[0] + "_timestamps.npy"
+        self.timestamps = np.load(timestamps_path) if os.path.exists(timestamps_path) else None
+        super().__init__(self.dump.shape[2], self.dump.shape[1], ring_slots, realtime, fps, loop)
+        self.start()
+
+    def read_frames(self):
+        for index in range(len(self.dump)):
+            if self.timestamps is not None:
+                source_time = float(self.timestamps[index])
+            else:
+                source_time = index / self.fps
+            yield self.dump[index], source_time
+
+
+# ===========================================================================================================
+# ================================================ FUNCTIONS ================================================
+# ===========================================================================================================
+def open_source(path, ring_slots=4, realtime=False, loop=False):
+    if os.path.isdir(path):
+        return ImageDirSource(path, ring_slots, realtime, loop=loop)
+    if path.endswith(".npy"):
+        return RawDumpSource(path, ring_slots, realtime, loop=loop)
+    return VideoFileSource(path, ring_slots, realtime, loop=loop)
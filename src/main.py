@@ -7,10 +7,23 @@ py:module::         main
                      values for the object size required for the distance calculation are stored.
                      The "DataCollected" class contains the "save_data" function, which can be used to save camera
                      frames with the information on the calculated distance and LED color associated with the frame.
-                     It also saves a JSON file with information about the image name, the filtered distance
-                     and the LED data send to the Arduino.
+                     It also appends a line to a JSON Lines file with information about the image name, the filtered
+                     distance and the LED data send to the Arduino. "save_data" only copies the frame into a bounded
+                     queue, the image and the line are written by a background thread, so saving never slows down the
+                     object detection. If the queue is full, the oldest (or with drop_policy="newest" the new) record
+                     is dropped. The images get unique names from the time and an increasing number.
                      The "main" of the "main.py" module starts the normal program. The saving of data is disabled
-                     and the BLE connection establishment and object detection are initiated.
+                     and the BLE connection establishment and object detection are initiated. With the argument
+                     "--pipeline" the object detection runs in the pipeline mode of the "pipeline" module. The
+                     argument "--display" selects whether the detections are shown in a window for every frame
+                     ("window"), in a rate-limited preview ("preview") or not at all ("headless"). The headless mode
+                     does not need an X display. With "--adaptive" the model only runs at full rate while a vehicle
+                     is near, see the "scheduler" module. "--source" replaces the camera by a recorded video, a
+                     directory of images or a frame dump (see the "frame_source" module). "--record" records the
+                     whole ride as video segments with the results of every frame (see the "recorder" module).
+                     The Arduino is connected in the background while the model and the camera start, so the object
+                     detection does not wait for it. The duration of every start stage is printed as soon as the
+                     first LED value is set (see the "startup" module).
 * Author:           Joanna Rieger
 * Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
                       eines rückwärtigen Abstands- und Annäherungswarners"
@@ -32,17 +45,30 @@ py:module::         main
 # ===========================================================================================================
 # ================================================= IMPORTS =================================================
 # ===========================================================================================================
+import argparse
+import itertools
 import json
 import os.path
+import queue
+import threading
 from datetime import time
-import time
 from datetime import datetime
+from threading import Thread
 import cv2
 import sys
 
 sys.path.append('/home/hshl/smb-safety_system')
 from src import object_detection
 from src import comm
+from src import frame_source
+from src import metrics
+from src import pipeline
+from src import regions
+from src import scheduler
+from src import startup
+
+DATA_RECORDS_DROPPED = metrics.registry.counter("data_records_dropped_total",
+                                                "Collected frames dropped because the writer was too slow")
 
 
 # ===========================================================================================================
@@ -56,7 +82,10 @@ class Paths:
         self.json_file_path_val = "/home/hshl/smb-safety_system/config/camera/picamera_val.json"
         self.json_file_path_DINA4 = "/home/hshl/smb-safety_system/config/camera/picamera_DINA4.json"
         self.test_imgs_path = "/home/hshl/smb-safety_system/tools/test_imgs/"
-        self.json_file_path_test = "/home/hshl/smb-safety_system/config/camera/picamera_test.json"
+        self.json_file_path_test = "/home/hshl/smb-safety_system/config/camera/picamera_test.jsonl"
+        self.metrics_file_path = "/home/hshl/metrics.prom"
+        self.output_cache_path = "/home/hshl/smb-safety_system/tools/output_cache/"
+        self.ble_cache_path = "/home/hshl/smb-safety_system/config/ble/arduino.json"
 
 
 class SizeClasses:
@@ -70,40 +99,143 @@ class SizeClasses:
 
 
 class DataCollected:
-    def __init__(self):
-        pass
-
-    @staticmethod
-    def save_data(frame_to_save, distance_filtered, led_data_send):
-        path = Paths().test_imgs_path
-        timestamp = int(time.time())
-        format_timestamp = datetime.fromtimestamp(timestamp)
-        readable_timestamp = format_timestamp.strftime('%Y-%m-%d_%H-%M-%S')
-        img_name = f"{readable_timestamp}.jpg"
-        cv2.imwrite(str(path) + str(img_name), frame_to_save)
-        print("> Image saved as {} to {}!".format(img_name, path))
-        test_dict = {"image name": img_name,
-                     "distance filtered": distance_filtered,
-                     "LED data send to Arduino": led_data_send}
-        if not os.path.exists(Paths().json_file_path_test):
-            with open(Paths().json_file_path_test, "w") as json_file:
-                json.dump([test_dict], json_file, indent=4)
-        else:
-            with open(Paths().json_file_path_test, "r") as json_file:
-                data_to_remain = json.load(json_file)
-            data_to_remain.append(test_dict)
-            with open(Paths().json_file_path_test, "w") as new_json_file:
-                json.dump(data_to_remain, new_json_file, indent=4)
+    def __init__(self, queue_size=8, drop_policy="oldest"):
+        self.path = Paths().test_imgs_path
+        self.json_path = Paths().json_file_path_test
+        self.drop_policy = drop_policy
+        self.records = queue.Queue(queue_size)
+        self.lock = threading.Lock()
+        self.numbers = itertools.count()
+        self.saved = 0
+        self.dropped = 0
+        self.stopped = False
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def save_data(self, frame_to_save, distance_filtered, led_data_send):
+        now = datetime.now()
+        img_name = "{}_{:03d}_{:06d}.jpg".format(now.strftime('%Y-%m-%d_%H-%M-%S'), now.microsecond // 1000,
+                                                 next(self.numbers))
+        # The frame is a copy made by "FrameRing.copy_frame" and is handed over without copying it again.
+        record = (img_name, frame_to_save, distance_filtered, led_data_send)
+        with self.lock:
+            try:
+                self.records.put_nowait(record)
+                return True
+            except queue.Full:
+                self.dropped += 1
+                DATA_RECORDS_DROPPED.inc()
+                if self.drop_policy == "newest":
+                    return False
+                try:
+                    self.records.get_nowait()
+                except queue.Empty:
+                    pass
+                self.records.put_nowait(record)
+                return True
+
+    def run(self):
+        with open(self.json_path, "a") as json_file:
+            while not (self.stopped and self.records.empty()):
+                try:
+                    img_name, frame_to_save, distance_filtered, led_data_send = self.records.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                cv2.imwrite(os.path.join(self.path, img_name), frame_to_save)
+                test_dict = {"image name": img_name,
+                             "distance filtered": distance_filtered,
+                             "LED data send to Arduino": led_data_send}
+                json_file.write(json.dumps(test_dict) + "\n")
+                json_file.flush()
+                self.saved += 1
+                print("> Image saved as {} to {}!".format(img_name, self.path))
+
+    def stop(self, timeout=5.0):
+        self.stopped = True
+        self.thread.join(timeout)
+        if self.dropped:
+            print("{} records could not be saved in time and were dropped".format(self.dropped))
 
 
 # ===========================================================================================================
 # ================================================== MAIN ===================================================
 # ===========================================================================================================
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pipeline", action="store_true",
+                        help="run preprocessing, inference, postprocessing and actuation in separate threads")
+    parser.add_argument("--queue-size", type=int, default=2,
+                        help="maximum number of frames waiting between two pipeline stages")
+    parser.add_argument("--display", choices=["window", "preview", "headless"], default="window",
+                        help="show every annotated frame, a rate-limited preview or nothing")
+    parser.add_argument("--preview-fps", type=float, default=5.0,
+                        help="frames per second of the preview")
+    parser.add_argument("--distance-window", type=int, default=10,
+                        help="number of frames combined to the distance shown by the LEDs")
+    parser.add_argument("--distance-filter", choices=["mean", "median"], default="mean",
+                        help="mean without outliers or median of the distances in the window")
+    parser.add_argument("--ttc-warning", type=float, default=2.0,
+                        help="time-to-collision in seconds below which the red LED is switched on")
+    parser.add_argument("--ttc-max-distance", type=float, default=40.0,
+                        help="distance in meters up to which the time-to-collision can switch on the red LED")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="run the model less often while no vehicle is near")
+    parser.add_argument("--idle-interval", type=float, default=0.5,
+                        help="seconds between two inferences while nothing is seen (worst-case detection latency)")
+    parser.add_argument("--idle-after", type=float, default=3.0,
+                        help="seconds without any detection after which the idle rate is used")
+    parser.add_argument("--source", default=None,
+                        help="video file, directory of JPEG images or .npy frame dump used instead of the camera")
+    parser.add_argument("--realtime", action="store_true",
+                        help="deliver the frames of --source with their recorded timing instead of as fast as possible")
+    parser.add_argument("--backend", choices=["auto", "edgetpu", "cpu"], default="auto",
+                        help="run the model on the Edge TPU, on the CPU or on the Edge TPU if it is available")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="number of CPU threads of the inference backend (default: all cores for the CPU)")
+    parser.add_argument("--roi", type=regions.parse_bounds, default=None,
+                        help="road region the model runs on as x_min,y_min,x_max,y_max in fractions of the frame")
+    parser.add_argument("--far-field", type=regions.parse_bounds, default=None,
+                        help="region of distant vehicles covered with full resolution tiles, format as --roi")
+    parser.add_argument("--tile-budget", type=int, default=0,
+                        help="number of far field tiles the model additionally runs on per frame")
+    parser.add_argument("--record", default=None,
+                        help="directory the ride is recorded to as video segments with per-frame metadata")
+    parser.add_argument("--segment-seconds", type=float, default=60.0,
+                        help="length of one recorded video segment in seconds")
+    parser.add_argument("--metrics-file", default=Paths().metrics_file_path,
+                        help="file the runtime metrics are written to in the Prometheus text format")
+    parser.add_argument("--metrics-interval", type=float, default=10.0,
+                        help="seconds between two writes of the metrics file")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="also serve the metrics on http://127.0.0.1:<port>/metrics")
+    args = parser.parse_args()
+    startup_report = startup.StartupReport()
+    # The Arduino is searched in the background while the model and the camera start, the LEDs are attached
+    # whenever it is found.
+    connector = comm.ArduinoConnector(comm.PeripheralCache(Paths().ble_cache_path))
+    arduino = comm.ConnectionSupervisor(connect=connector, on_connect=lambda peripheral: startup_report.mark("ble"))
+    exporter = metrics.MetricsExporter(args.metrics_file, args.metrics_interval, args.metrics_port)
+    inference_scheduler = None
+    if args.adaptive:
+        inference_scheduler = scheduler.InferenceScheduler(idle_interval=args.idle_interval,
+                                                           idle_after=args.idle_after)
+
     to_save = False
-    arduino = comm.rpi_comm_setup()
-    check, arduino = comm.rpi_connection_check(arduino)
-    while not check:
-        check, arduino = comm.rpi_connection_check(arduino)
-    ob = object_detection.ObjectDetection()
-    ob.object_detect(to_save, arduino)
+    ring_slots = pipeline.DetectionPipeline.ring_slots(args.queue_size) if args.pipeline else 4
+    source = None
+    if args.source is not None:
+        source = frame_source.open_source(args.source, ring_slots, args.realtime)
+    ob = object_detection.ObjectDetection(ring_slots=ring_slots, display_mode=args.display,
+                                          preview_fps=args.preview_fps, distance_window=args.distance_window,
+                                          distance_method=args.distance_filter, ttc_warning=args.ttc_warning,
+                                          scheduler=inference_scheduler, frame_source=source, backend=args.backend,
+                                          num_threads=args.threads, roi_bounds=args.roi, far_field=args.far_field,
+                                          tile_budget=args.tile_budget, startup_report=startup_report,
+                                          ttc_max_distance=args.ttc_max_distance)
+    if args.record is not None:
+        ob.start_recording(args.record, args.segment_seconds)
+    if args.pipeline:
+        pipeline.DetectionPipeline(ob, args.queue_size).run(to_save, arduino)
+    else:
+        ob.object_detect(to_save, arduino)
+    exporter.stop()
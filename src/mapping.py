@@ -3,10 +3,18 @@ py:module::         mapping
 
 * Filename:         mapping.py
 * Description:      This module contains the "DistanceCalc" class. It can be used to calculate the distance between an
-                     object and the camera using object detection. This class also has functions for finding the
-                     shortest distance in a single frame and for combining distances from several camera frames and
-                     grouping them using their average and standard deviation. In the "map_distance_to_leds" function,
-                     the determined distance is converted to one of the three LED colors.
+                     object and the camera using object detection. The focal length and the object widths are taken
+                     from the calibration registry of the "calibration" module, so they are only read once. This class
+                     also has functions for finding the shortest distance in a single frame and for combining
+                     distances from several camera frames and grouping them using their average and standard
+                     deviation. In the "map_distance_to_leds" function, the determined distance is converted to one of
+                     the three LED colors. If a vehicle would reach the bicycle within "ttc_warning" seconds, the
+                     red LED is chosen regardless of the distance. The tracker only gives a time-to-collision for
+                     vehicles that approached over several frames and are close enough to measure their speed.
+                     The "StreamingDistance" class combines the distances of the last frames continuously. It is
+                     updated with every frame: the running sum and sum of squares of the window give average and
+                     standard deviation in O(1), distances above average plus standard deviation are rejected like in
+                     "summarized_distance". Alternatively the median of the window can be used.
 * Author:           Joanna Rieger
 * Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
                       eines rückwärtigen Abstands- und Annäherungswarners"
@@ -28,34 +36,41 @@ py:module::         mapping
 # ===========================================================================================================
 # ================================================= IMPORTS =================================================
 # ===========================================================================================================
-import json
+import bisect
+import math
 import sys
+from collections import deque
 import numpy as np
 
 sys.path.append('/home/hshl/smb-safety_system')
-from src import main
+from src import calibration
 from src import comm
+from src import metrics
 
+RED_DISTANCE = 25
+YELLOW_DISTANCE = 50
+
+DISTANCE_SHOWN = metrics.registry.gauge("distance_shown_meters", "Filtered distance shown by the LEDs")
+DISTANCE_SAMPLES = metrics.registry.counter("distance_samples_total", "Distances added to the distance filter")
 
 # ===========================================================================================================
 # ================================================= CLASSES =================================================
 # ===========================================================================================================
 class DistanceCalc:
-    def __init__(self):
+    def __init__(self, resolution=None):
         self.focal_length = None
+        self.resolution = resolution
+        self.registry = calibration.get_registry()
 
         self.get_focal_length()
 
     def get_focal_length(self):
-        with open(main.Paths().json_file_path_DINA4, "r") as json_file:
-            json_data = json.load(json_file)
-        if "calibration image" in json_data:
-            self.focal_length = json_data["calibration image"].get("focal length")
+        self.focal_length = self.registry.focal_length(self.resolution)
+        return self.focal_length
 
     def distance_calculation(self, width_bounding_box, class_object):
-        main_classes = main.SizeClasses()
-        width_object = main_classes.class_to_size[class_object]
-        distance_object = (width_object * self.focal_length) / width_bounding_box
+        width_object = self.registry.class_width(class_object)
+        distance_object = (width_object * self.get_focal_length()) / width_bounding_box
         return distance_object
 
     @staticmethod
@@ -70,16 +85,88 @@ class DistanceCalc:
             if distances[i] <= (distances_avg - distances_stdev) or distances[i] <= (distances_avg + distances_stdev):
                 distances_sorted.append(distances[i])
         distance_to_show = np.mean(distances_sorted)
+        DISTANCE_SAMPLES.inc(len(distances))
+        DISTANCE_SHOWN.set(distance_to_show)
         led_val = self.map_distance_to_leds(distance_to_show, arduino)
         return distance_to_show, led_val
 
     @staticmethod
-    def map_distance_to_leds(dist_to_map, arduino):
-        if dist_to_map < 25:
+    def map_distance_to_leds(dist_to_map, arduino, time_to_collision=None, ttc_warning=2.0):
+        if time_to_collision is not None and time_to_collision < ttc_warning:
+            led_on = "red"
+        elif dist_to_map < RED_DISTANCE:
             led_on = "red"
-        elif 25 <= dist_to_map < 50:
+        elif RED_DISTANCE <= dist_to_map < YELLOW_DISTANCE:
             led_on = "yellow"
         else:
             led_on = "green"
         led_value = comm.rpi_send_data(led_on, arduino)
         return led_value
+
+
+class StreamingDistance:
+    def __init__(self, window=10, method="mean", k_stdev=1.0):
+        self.window = window
+        self.method = method
+        self.k_stdev = k_stdev
+        self.distances = deque()
+        self.sorted_distances = []
+        self.sum = 0.0
+        self.sum_squares = 0.0
+        self.updates = 0
+
+    def update(self, distance):
+        distance = float(distance)
+        self.distances.append(distance)
+        bisect.insort(self.sorted_distances, distance)
+        self.sum += distance
+        self.sum_squares += distance * distance
+        if len(self.distances) > self.window:
+            oldest = self.distances.popleft()
+            del self.sorted_distances[bisect.bisect_left(self.sorted_distances, oldest)]
+            self.sum -= oldest
+            self.sum_squares -= oldest * oldest
+        self.updates += 1
+        if self.updates % 1000 == 0:
+            # Recompute the running sums now and then so rounding errors cannot add up over a long ride.
+            self.sum = sum(self.distances)
+            self.sum_squares = sum(d * d for d in self.distances)
+        DISTANCE_SAMPLES.inc()
+        value = self.value()
+        DISTANCE_SHOWN.set(value)
+        return value
+
+    def mean(self):
+        return self.sum / len(self.distances)
+
+    def stdev(self):
+        variance = self.sum_squares / len(self.distances) - self.mean() ** 2
+        return math.sqrt(max(0.0, variance))
+
+    def median(self):
+        count = len(self.sorted_distances)
+        middle = count // 2
+        if count % 2:
+            return self.sorted_distances[middle]
+        return (self.sorted_distances[middle - 1] + self.sorted_distances[middle]) / 2
+
+    def value(self):
+        if not self.distances:
+            return None
+        if self.method == "median":
+            return self.median()
+        # Only the few largest distances can lie above the limit, so they are taken from the end of the sorted
+        # window instead of looking at every distance.
+        limit = self.mean() + self.k_stdev * self.stdev()
+        kept_sum = self.sum
+        kept_count = len(self.sorted_distances)
+        while kept_count > 1 and self.sorted_distances[kept_count - 1] > limit:
+            kept_count -= 1
+            kept_sum -= self.sorted_distances[kept_count]
+        return kept_sum / kept_count
+
+    def reset(self):
+        self.distances.clear()
+        self.sorted_distances = []
+        self.sum = 0.0
+        self.sum_squares = 0.0
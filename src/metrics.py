@@ -0,0 +1,221 @@
+"""
+py:module::         metrics
+
+* Filename:         metrics.py
+* Description:      This module contains the runtime metrics of the safety system. "Counter" counts events (e.g.
+                     processed frames or failed BLE writes), "Gauge" holds the latest value of a quantity (e.g. the
+                     distance shown by the LEDs) and "Histogram" counts durations in fixed buckets (e.g. the
+                     inference time), so recording a value is only a lookup and an addition.
+                     All metrics are created in the "MetricsRegistry" of this module with "counter", "gauge" and
+                     "histogram", which return the existing metric if the name is already known.
+                     The "MetricsExporter" writes all metrics in the Prometheus text format into a file every
+                     "interval" seconds and, if a port is given, serves them on http://127.0.0.1:<port>/metrics.
+* Author:           Joanna Rieger
+* Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
+                      eines rückwärtigen Abstands- und Annäherungswarners"
+* E-Mail:           joanna.rieger@stud.hshl.de
+* Project Sources:
+    * Source:           https://github.com/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi
+    * Source:           https://colab.research.google.com/github/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi/blob/master/Train_TFLite2_Object_Detction_Model.ipynb
+    * Source:           https://pyimagesearch.com/2015/01/19/find-distance-camera-objectmarker-using-python-opencv/
+    * Source:           https://www.welt.de/motor/news/article244937978/Jedes-Jahr-ein-Zentimeter-mehr-Laengenwachstum-bei-Pkw.html#:~:text=Zwischen%202000%20und%202022%20ist,von%20einem%20Zentimeter%20pro%20Jahr.
+    * Source:           https://www.ardalpha.de/wissen/geschichte/kulturgeschichte/din-a4-din-normen-100-jahre-100.html#:~:text=Die%20wohl%20bekannteste%20DIN%2DNorm%20ist%20die%20DIN%20EN%20ISO,noch%20in%20den%20Drucker%20legen.
+    * Source:           https://jashuang1983.wordpress.com/rpi4-ble-with-arduino-nano-33/
+    * Source:           https://docs.arduino.cc/tutorials/nano-33-ble-sense/bluetooth/
+    * Source:           https://github.com/OpenBluetoothToolbox/SimpleBLE/blob/main/examples/simplepyble/write.py
+    * Source:           https://blog.finxter.com/5-best-ways-to-convert-python-csv-to-xml-using-elementtree/
+    * Source:           https://stackoverflow.com/questions/15679467/parse-all-the-xml-files-in-a-directory-one-by-one-using-elementtree
+    * Source:           https://chatgpt.com/
+"""
+
+# ===========================================================================================================
+# ================================================= IMPORTS =================================================
+# ===========================================================================================================
+import bisect
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from threading import Thread
+
+# Buckets in seconds for the durations of the detection loop and the BLE writes.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+# ===========================================================================================================
+# ================================================= CLASSES =================================================
+# ===========================================================================================================
+class Counter:
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def render(self):
+        return ["# HELP {} {}".format(self.name, self.description),
+                "# TYPE {} counter".format(self.name),
+                "{} {}".format(self.name, format_value(self.value))]
+
+
+class Gauge:
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def render(self):
+        return ["# HELP {} {}".format(self.name, self.description),
+                "# TYPE {} gauge".format(self.name),
+                "{} {}".format(self.name, format_value(self.value))]
+
+
+class Histogram:
+    def __init__(self, name, description, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self):
+        with self.lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        lines = ["# HELP {} {}".format(self.name, self.description),
+                 "# TYPE {} histogram".format(self.name)]
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append('{}_bucket{{le="{}"}} {}'.format(self.name, format_value(bound), cumulative))
+        lines.append('{}_bucket{{le="+Inf"}} {}'.format(self.name, count))
+        lines.append("{}_sum {}".format(self.name, format_value(total)))
+        lines.append("{}_count {}".format(self.name, count))
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def get(self, metric_class, name, description, *args):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = metric_class(name, description, *args)
+                self.metrics[name] = metric
+            elif not isinstance(metric, metric_class):
+                raise ValueError("Metric {} is already a {}".format(name, type(metric).__name__))
+            return metric
+
+    def counter(self, name, description):
+        return self.get(Counter, name, description)
+
+    def gauge(self, name, description):
+        return self.get(Gauge, name, description)
+
+    def histogram(self, name, description, buckets=LATENCY_BUCKETS):
+        return self.get(Histogram, name, description, buckets)
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    def __init__(self, path=None, interval=10.0, port=None, metrics_registry=None):
+        self.path = path
+        self.interval = interval
+        self.port = port
+        self.registry = metrics_registry if metrics_registry is not None else registry
+        self.stopped = threading.Event()
+        self.server = None
+
+        if self.path is not None:
+            Thread(target=self.run, daemon=True).start()
+        if self.port is not None:
+            self.start_server()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        # The file is replaced in one step, so a reader never sees a half written file.
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as metrics_file:
+                metrics_file.write(self.registry.render())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print("Metrics could not be written to {}: {}".format(self.path, e))
+
+    def start_server(self):
+        metrics_registry = self.registry
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics_registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), MetricsHandler)
+        self.server.daemon_threads = True
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        print("Metrics served on http://127.0.0.1:{}/metrics".format(self.port))
+
+    def stop(self):
+        self.stopped.set()
+        if self.path is not None:
+            self.flush()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+# ===========================================================================================================
+# ================================================ FUNCTIONS ================================================
+# ===========================================================================================================
+def format_value(value):
+    value = float(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,125 @@
+"""
+py:module::         model_input
+
+* Filename:         model_input.py
+* Description:      This module contains the "ModelInput" class, which writes the camera frames into the input
+                     tensor of the model without allocating memory per frame. The type and quantization of the input
+                     tensor are checked once at the start:
+                        - uint8:   the RGB pixels are written unchanged (quantized models, e.g. for the Edge TPU)
+                        - int8:    the RGB pixels are shifted by 128 (models quantized to signed integers)
+                        - float32: the RGB pixels are normalized to -1...1 with mean and standard deviation 127.5
+                     For uint8 and int8 the scale and zero point of the input tensor decide which range of real
+                     values the model was trained with, 0...1 or -1...1. The pixels are quantized into it with a
+                     lookup table, unless the result differs by at most 1 from the unchanged or shifted pixels, which
+                     holds for the usual quantizations and keeps the faster path. Other ranges are rejected.
+                     "write" resizes the BGR frame into a preallocated buffer and converts it to RGB directly into the
+                     input tensor of the interpreter ("interpreter.tensor()"), so "set_tensor" and its copy are not
+                     needed. Resizing before converting gives the same pixels as converting first, but only the small
+                     image is converted. For the pipeline mode, in which the next frame is preprocessed while the
+                     model still runs, "write" can also fill one of the buffers of "new_buffer", which "load" copies
+                     into the input tensor right before the inference.
+* Author:           Joanna Rieger
+* Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
+                      eines rückwärtigen Abstands- und Annäherungswarners"
+* E-Mail:           joanna.rieger@stud.hshl.de
+* Project Sources:
+    * Source:           https://github.com/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi
+    * Source:           https://colab.research.google.com/github/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi/blob/master/Train_TFLite2_Object_Detction_Model.ipynb
+    * Source:           https://pyimagesearch.com/2015/01/19/find-distance-camera-objectmarker-using-python-opencv/
+    * Source:           https://www.welt.de/motor/news/article244937978/Jedes-Jahr-ein-Zentimeter-mehr-Laengenwachstum-bei-Pkw.html#:~:text=Zwischen%202000%20und%202022%20ist,von%20einem%20Zentimeter%20pro%20Jahr.
+    * Source:           https://www.ardalpha.de/wissen/geschichte/kulturgeschichte/din-a4-din-normen-100-jahre-100.html#:~:text=Die%20wohl%20bekannteste%20DIN%2DNorm%20ist%20die%20DIN%20EN%20ISO,noch%20in%20den%20Drucker%20legen.
+    * Source:           https://jashuang1983.wordpress.com/rpi4-ble-with-arduino-nano-33/
+    * Source:           https://docs.arduino.cc/tutorials/nano-33-ble-sense/bluetooth/
+    * Source:           https://github.com/OpenBluetoothToolbox/SimpleBLE/blob/main/examples/simplepyble/write.py
+    * Source:           https://blog.finxter.com/5-best-ways-to-convert-python-csv-to-xml-using-elementtree/
+    * Source:           https://stackoverflow.com/questions/15679467/parse-all-the-xml-files-in-a-directory-one-by-one-using-elementtree
+    * Source:           https://chatgpt.com/
+"""
+
+# ===========================================================================================================
+# ================================================= IMPORTS =================================================
+# ===========================================================================================================
+import cv2
+import numpy as np
+
+FLOAT_INPUT_MEAN = 127.5
+FLOAT_INPUT_STD = 127.5
+# Allowed difference between the range of the quantized input and 0...1 or -1...1.
+RANGE_TOLERANCE = 0.05
+
+
+# ===========================================================================================================
+# ================================================= CLASSES =================================================
+# ===========================================================================================================
+class ModelInput:
+    def __init__(self, interpreter, input_details):
+        self.index = input_details['index']
+        self.dtype = np.dtype(input_details['dtype'])
+        self.shape = tuple(int(size) for size in input_details['shape'])
+        self.height, self.width = self.shape[1], self.shape[2]
+        if self.dtype not in (np.uint8, np.int8, np.float32):
+            raise ValueError("Model input of type {} is not supported".format(self.dtype))
+        self.quantization = tuple(input_details.get('quantization', (0.0, 0)))
+        print("Model input: {}x{} {}, quantization {}".format(self.width, self.height, self.dtype, self.quantization))
+        self.table = None
+        if self.dtype != np.float32:
+            self.table = quantization_table(self.dtype, *self.quantization)
+        # The function is fetched once; the array it returns must not be kept while the model runs.
+        self.tensor = interpreter.tensor(self.index)
+        self.resized = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self.rgb = np.empty((self.height, self.width, 3), dtype=np.uint8)
+
+    def new_buffer(self):
+        return np.empty(self.shape, dtype=self.dtype)
+
+    def write(self, frame=None, model_input=None, out=None):
+        target = self.tensor() if out is None else out
+        if model_input is not None:
+            # Already RGB in the input size of the model (lores stream of the camera).
+            rgb = model_input
+        else:
+            cv2.resize(frame, (self.width, self.height), dst=self.resized)
+            if self.dtype == np.uint8 and self.table is None:
+                cv2.cvtColor(self.resized, cv2.COLOR_BGR2RGB, dst=target[0])
+                return out
+            cv2.cvtColor(self.resized, cv2.COLOR_BGR2RGB, dst=self.rgb)
+            rgb = self.rgb
+        if self.table is not None:
+            np.take(self.table, rgb, out=target[0], mode='clip')
+        elif self.dtype == np.uint8:
+            np.copyto(target[0], rgb)
+        elif self.dtype == np.int8:
+            np.bitwise_xor(rgb, 0x80, out=target[0].view(np.uint8))
+        else:
+            # Converted first and normalized in place, so NumPy needs no temporary buffer for mixed types.
+            np.copyto(target[0], rgb, casting='unsafe')
+            np.subtract(target[0], FLOAT_INPUT_MEAN, out=target[0])
+            np.multiply(target[0], 1.0 / FLOAT_INPUT_STD, out=target[0])
+        return out
+
+    def load(self, buffer):
+        np.copyto(self.tensor(), buffer)
+
+
+# ===========================================================================================================
+# ================================================ FUNCTIONS ================================================
+# ===========================================================================================================
+def quantization_table(dtype, scale, zero_point):
+    # Returns None if the pixels can be written unchanged (uint8) or shifted by 128 (int8).
+    if scale == 0:
+        return None
+    info = np.iinfo(dtype)
+    low, high = scale * (info.min - zero_point), scale * (info.max - zero_point)
+    pixels = np.arange(256, dtype=np.float64)
+    if abs(low) <= RANGE_TOLERANCE and abs(high - 1) <= RANGE_TOLERANCE:
+        real = pixels / 255.0
+    elif abs(low + 1) <= RANGE_TOLERANCE and abs(high - 1) <= RANGE_TOLERANCE:
+        real = (pixels - FLOAT_INPUT_MEAN) / FLOAT_INPUT_STD
+    else:
+        raise ValueError("Model input quantization {} covers {:.3f}...{:.3f}, expected 0...1 or -1...1".format(
+            (scale, zero_point), low, high))
+    table = np.clip(np.round(real / scale + zero_point), info.min, info.max)
+    default = pixels if dtype == np.uint8 else pixels - 128
+    if np.max(np.abs(table - default)) <= 1:
+        return None
+    return table.astype(dtype)
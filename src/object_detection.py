@@ -3,10 +3,34 @@ py:module::         object_detection
 
 * Filename:         object_detection.py
 * Description:      This module is used for object detection. In addition to the object detection, the "object_detect"
-                     function controls/ initiates the distance calculation, the sending of data and regularly checks
-                     the BLE connection to the Arduino by calling the corresponding functions. If the function was
-                     called with the request to save the data, it also starts this process here by calling the
-                     corresponding function.
+                     function controls/ initiates the distance calculation and the sending of data. The BLE connection
+                     to the Arduino is watched by the "ConnectionSupervisor" of the "comm" module in the background.
+                     If the function was called with the request to save the data, it also starts this process here
+                     by calling the corresponding function. The raw outputs of the model are turned into detections with distances
+                     by the "DetectionDecoder" of the "decoding" module. The detections are followed over the frames
+                     by the "DetectionTracker" of the "tracking" module to get the time-to-collision of every vehicle.
+                     If an "InferenceScheduler" of the "scheduler" module is given, the model only runs on the frames
+                     it selects, the LEDs are updated with the distances extrapolated by the tracker in between.
+                     The frames come from the Pi camera or from any other "FrameSource" of the "frame_source" module.
+                     The "display_mode" decides what happens with the detections on the display: "window" annotates
+                     and shows every frame, "preview" hands the frames to the "OverlayRenderer" of the "overlay"
+                     module, which shows them in its own thread with a lower rate, and "headless" skips all drawing.
+                     The model is run by the backend of the "backends" module selected with "backend": the Edge TPU,
+                     the CPU or, with "auto", the Edge TPU if it is available and the CPU otherwise.
+                     "start_recording" records the camera stream and the results of every frame with the
+                     "RideRecorder" of the "recorder" module.
+                     If the frame source delivers a second, low resolution stream in the input size of the model
+                     (the "lores" stream of the Pi camera), the model runs on it and the full frame is neither
+                     converted nor resized.
+                     With "roi_bounds" the model only runs on the road ("region of interest") cropped from the full
+                     frame. With "far_field" and "tile_budget" the model additionally runs on up to "tile_budget"
+                     tiles of the far field per frame in full camera resolution, which finds distant vehicles earlier.
+                     The detections of the tiles are merged with the others in full frame coordinates (see the
+                     "regions" module).
+                     The start is measured by a "StartupReport" of the "startup" module. The first inference, which
+                     loads the model onto the Edge TPU, runs while the camera starts, and the report is printed as soon
+                     as the first LED value is set. "object_detect" also accepts a running "ConnectionSupervisor", so
+                     the detection does not wait for the BLE connection.
 * Author:           Joanna Rieger
 * Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
                       eines rückwärtigen Abstands- und Annäherungswarners"
@@ -28,131 +52,266 @@ py:module::         object_detection
 # ===========================================================================================================
 # ================================================= IMPORTS =================================================
 # ===========================================================================================================
+import math
 import os
 import sys
-import numpy as np
 import cv2
-from time import sleep
 import time
 
 sys.path.append('/home/hshl/smb-safety_system')
-from src import camera
+from src import backends
+from src import decoding
 from src import mapping
+from src import metrics
+from src import model_input
+from src import overlay
+from src import recorder
+from src import regions
+from src import startup
+from src import tracking
 from src import comm
 from src import main
 
-from tflite_runtime.interpreter import Interpreter
-from tflite_runtime.interpreter import load_delegate
+FRAMES_PROCESSED = metrics.registry.counter("frames_processed_total", "Frames the object detection was run on")
+FRAMES_SKIPPED = metrics.registry.counter("frames_skipped_total",
+                                          "Frames the inference scheduler skipped and the tracker extrapolated")
+FRAMES_DROPPED = metrics.registry.counter("frames_dropped_total",
+                                          "Camera frames overwritten or dropped before they were processed")
+INFERENCE_SECONDS = metrics.registry.histogram("inference_seconds", "Duration of one inference of the model")
+FRAME_LATENCY_SECONDS = metrics.registry.histogram("frame_latency_seconds",
+                                                   "Time from the capture of a frame until its LED value is set")
+LED_CHANGES = metrics.registry.counter("led_changes_total", "Changes of the LED color")
+LED_STATE = metrics.registry.gauge("led_state", "LED color shown: 1 red, 2 yellow, 3 green, 0 off")
 
 
 # ===========================================================================================================
 # ================================================= CLASSES =================================================
 # ===========================================================================================================
 class ObjectDetection:
-    def __init__(self):
+    def __init__(self, ring_slots=4, display_mode="window", preview_fps=5.0, distance_window=10,
+                 distance_method="mean", ttc_warning=2.0, scheduler=None, frame_source=None, backend="auto",
+                 num_threads=None, roi_bounds=None, far_field=None, tile_budget=0, startup_report=None,
+                 ttc_max_distance=40.0):
         print("Object Detection initialization started!")
-        self.cam = camera.CameraOD()
         self.stopped = False
         self.MODEL_NAME = "/home/hshl/smb-safety_system/config/tensorflow/custom_model_lite/"
-        self.GRAPH_NAME = "edgetpu.tflite"
         self.LABELMAP_NAME = "labelmap.txt"
         self.CWD_PATH = os.getcwd()
-        self.PATH_TO_TFLITE = os.path.join(self.CWD_PATH, self.MODEL_NAME, self.GRAPH_NAME)
         self.PATH_TO_LABELS = os.path.join(self.CWD_PATH, self.MODEL_NAME, self.LABELMAP_NAME)
         self.min_conf_threshold = 0.5
-        self.resW = self.cam.width_picam
-        self.resH = self.cam.height_picam
-        self.imW = int(self.resW)
-        self.imH = int(self.resH)
 
-        with open(self.PATH_TO_LABELS, 'r') as f:
-            self.labels = [line.strip() for line in f.readlines()]
-
-        self.interpreter = Interpreter(model_path=self.PATH_TO_TFLITE,
-                                       experimental_delegates=[load_delegate('libedgetpu.so.1.0')])
+        self.startup = startup_report if startup_report is not None else startup.StartupReport()
 
-        self.interpreter.allocate_tensors()
+        # The model is loaded first, so the camera can deliver frames in the input size of the model.
+        with self.startup.stage("model"):
+            self.backend, self.interpreter = backends.load_backend(
+                backend, os.path.join(self.CWD_PATH, self.MODEL_NAME), num_threads)
 
         self.input_details = self.interpreter.get_input_details()
         self.output_details = self.interpreter.get_output_details()
         self.height = self.input_details[0]['shape'][1]
         self.width = self.input_details[0]['shape'][2]
+        self.model_input = model_input.ModelInput(self.interpreter, self.input_details[0])
+        # The first inference loads the model onto the Edge TPU, it runs while the camera starts.
+        warm_up = self.startup.submit("warm_up", backends.measure_speed, self.interpreter)
 
         self.boxes_idx, self.classes_idx, self.scores_idx = 1, 3, 0
 
+        if frame_source is None:
+            # Imported here so that recorded frames can be processed on computers without the Pi camera library.
+            from src import camera
+            # The lores stream shows the whole frame, with a region of interest the model input is cropped from
+            # the full frame instead.
+            with self.startup.stage("camera"):
+                frame_source = camera.CameraOD(ring_slots, (self.width, self.height) if roi_bounds is None else None)
+        self.cam = frame_source
+        self.resW = self.cam.width_picam
+        self.resH = self.cam.height_picam
+        self.imW = int(self.resW)
+        self.imH = int(self.resH)
+        self.distance_calc = mapping.DistanceCalc((self.imW, self.imH))
+        self.region = regions.to_region(roi_bounds, (self.imW, self.imH)) if roi_bounds is not None else None
+        self.tiles = None
+        self.tile_buffers = []
+        if far_field is not None and tile_budget > 0:
+            self.tiles = regions.TilePlanner(far_field, (self.imW, self.imH), (self.width, self.height), tile_budget)
+            self.tile_buffers = [self.model_input.new_buffer() for _ in range(tile_budget)]
+        self.distance_filter = mapping.StreamingDistance(distance_window, distance_method)
+        self.tracker = tracking.DetectionTracker(max_distance=ttc_max_distance)
+        self.ttc_warning = ttc_warning
+        self.time_to_collision = math.inf
+        self.scheduler = scheduler
+        self.distance_to_show = None
+        self.led_val = None
+        self.start_time = self.millis()
+        self.supervisor = None
+        self.data_collected = None
+        self.recorder = None
+
+        with open(self.PATH_TO_LABELS, 'r') as f:
+            self.labels = [line.strip() for line in f.readlines()]
+        self.decoder = decoding.DetectionDecoder(self.labels, self.imW, self.imH, self.min_conf_threshold)
+        self.display_mode = display_mode
+        self.renderer = None
+        if self.display_mode == "preview":
+            self.renderer = overlay.OverlayRenderer(self.labels, self.cam.frames, preview_fps)
+
+        self.inference_ms = warm_up.result()
+        print("Inference backend: {} ({} threads), {:.1f} ms per inference".format(
+            self.backend.name, self.backend.num_threads or "default", self.inference_ms))
+
     @staticmethod
     def millis():
         return int(time.monotonic() * 1000)
 
     def object_detect(self, data_saver, arduino):
-        frame = None
-        distance_to_show = None
-        led_val = None
-        sleep(0.5)
-        shortest_distance_list = []
-        frame_counter = 0
-        start_time = self.millis()
+        frame_seq = -1
+        self.start_actuation(arduino)
         while not self.stopped:
-            if frame_counter < 10:
-                frame_counter += 1
-                distances_in_frame = []
-                frame1 = self.cam.usable_frame
-                frame = frame1.copy()
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                frame_resized = cv2.resize(frame_rgb, (self.width, self.height))
-                input_data = np.expand_dims(frame_resized, axis=0)
-
-                self.interpreter.set_tensor(self.input_details[0]['index'], input_data)
-                self.interpreter.invoke()
-
-                boxes = self.interpreter.get_tensor(self.output_details[self.boxes_idx]['index'])[0]
-                classes = self.interpreter.get_tensor(self.output_details[self.classes_idx]['index'])[0]
-                scores = self.interpreter.get_tensor(self.output_details[self.scores_idx]['index'])[0]
-
-                for i in range(len(scores)):
-                    if (scores[i] > self.min_conf_threshold) and (scores[i] <= 1.0):
-                        ymin = int(max(1, (boxes[i][0] * self.imH)))
-                        xmin = int(max(1, (boxes[i][1] * self.imW)))
-                        ymax = int(min(self.imH, (boxes[i][2] * self.imH)))
-                        xmax = int(min(self.imW, (boxes[i][3] * self.imW)))
-                        wbb = self.width_bounding_box(xmin, xmax)
-
-                        cv2.rectangle(frame, (xmin, ymin), (xmax, ymax), (252, 15, 192), 2)
-
-                        object_name = self.labels[int(classes[i])]
-                        cob = object_name
-                        distance_calculated = mapping.DistanceCalc().distance_calculation(wbb, cob)
-                        distances_in_frame.append(distance_calculated)
-                        label = '%s: %d%%, Distance: %dm' % (object_name, int(scores[i] * 100), distance_calculated)
-                        label_size, base_line = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)
-                        label_ymin = max(ymin, label_size[1] + 10)
-                        cv2.rectangle(frame, (xmin, label_ymin - label_size[1] - 10),
-                                      (xmin + label_size[0], label_ymin + base_line - 10), (255, 255, 255),
-                                      cv2.FILLED)
-                        cv2.putText(frame, label, (xmin, label_ymin - 7), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0),
-                                    2)
-                if distances_in_frame:
-                    shortest_distance = mapping.DistanceCalc().find_shortest_distance_in_frame(distances_in_frame)
-                    shortest_distance_list.append(shortest_distance)
-                else:
-                    shortest_distance_list.append(2000)
-
-                cv2.imshow('Object detector', frame)
-                cv2.waitKey(1)
-            else:
-                distance_to_show, led_val = mapping.DistanceCalc().summarized_distance(shortest_distance_list, arduino)
-                frame_counter = 0
-                shortest_distance_list = []
-
-            current_time = self.millis()
-            if (current_time - start_time) >= 5000:
-                _, arduino = comm.rpi_connection_check(arduino)
-                start_time = self.millis()
-                if data_saver:
-                    main.DataCollected().save_data(frame, distance_to_show, led_val)
+            latest = self.cam.get_latest(frame_seq)
+            if latest is None:
+                break
+            self.count_dropped(frame_seq, latest[0])
+            frame_seq, frame_time, frame1 = latest
+            if not self.should_infer(frame_time):
+                self.extrapolation(frame_time)
+                continue
+            tile_inputs = self.preprocess_tiles(frame1)
+            input_data = self.preprocess(frame1, frame_seq)
+            boxes, classes, scores = self.inference(input_data)
+            detections = self.postprocess(boxes, classes, scores)
+            detections = self.merge_tiles(detections, self.infer_tiles(tile_inputs))
+            frame = self.show(frame_seq, frame1, detections)
+            self.actuation(detections, frame_time, frame, data_saver, frame_seq)
 
         self.stop_object_detection()
 
+    def preprocess(self, frame, frame_seq=None, out=None, region=None):
+        # Without "out" the frame is written directly into the input tensor of the model and None is returned.
+        if region is None:
+            region = self.region
+        if region is not None:
+            return self.model_input.write(regions.crop(frame, region), None, out)
+        lores = self.cam.get_model_input(frame_seq) if frame_seq is not None else None
+        return self.model_input.write(frame, lores, out)
+
+    def preprocess_tiles(self, frame, buffers=None):
+        if self.tiles is None:
+            return []
+        if buffers is None:
+            buffers = self.tile_buffers
+        return [(tile, self.preprocess(frame, out=buffer, region=tile))
+                for tile, buffer in zip(self.tiles.next_tiles(), buffers)]
+
+    def inference(self, input_data=None):
+        start = time.monotonic()
+        if input_data is not None:
+            self.model_input.load(input_data)
+        self.interpreter.invoke()
+        INFERENCE_SECONDS.observe(time.monotonic() - start)
+
+        boxes = self.interpreter.get_tensor(self.output_details[self.boxes_idx]['index'])[0]
+        classes = self.interpreter.get_tensor(self.output_details[self.classes_idx]['index'])[0]
+        scores = self.interpreter.get_tensor(self.output_details[self.scores_idx]['index'])[0]
+        return boxes, classes, scores
+
+    def infer_tiles(self, tile_inputs):
+        return [(tile,) + tuple(self.inference(input_data)) for tile, input_data in tile_inputs]
+
+    def postprocess(self, boxes, classes, scores, region=None):
+        return self.decoder.decode(boxes, classes, scores, region=self.region if region is None else region)
+
+    def merge_tiles(self, detections, tile_outputs):
+        if not tile_outputs:
+            return detections
+        tile_detections = [self.tiles.complete(self.postprocess(boxes, classes, scores, tile), tile)
+                           for tile, boxes, classes, scores in tile_outputs]
+        return regions.merge_detections([detections] + tile_detections)
+
+    def show(self, frame_seq, frame, detections):
+        if self.display_mode == "window":
+            # The frame was taken before the inference, the camera may have overwritten its slot since then.
+            frame = self.cam.frames.copy_frame(frame_seq, frame)
+            if frame is None:
+                return None
+            overlay.draw_detections(frame, detections, self.labels)
+            self.display(frame)
+        elif self.display_mode == "preview":
+            self.renderer.submit(frame_seq, frame, detections)
+        return frame
+
+    @staticmethod
+    def display(frame):
+        cv2.imshow('Object detector', frame)
+        cv2.waitKey(1)
+
+    def start_recording(self, directory, segment_seconds=60.0):
+        self.recorder = recorder.RideRecorder(self.cam, directory, segment_seconds, labels=self.labels)
+
+    def start_actuation(self, arduino):
+        if isinstance(arduino, comm.ConnectionSupervisor):
+            self.supervisor = arduino
+        else:
+            self.supervisor = comm.ConnectionSupervisor(arduino)
+        self.start_time = self.millis()
+
+    def should_infer(self, frame_time):
+        if self.scheduler is None or self.scheduler.should_infer(frame_time):
+            return True
+        FRAMES_SKIPPED.inc()
+        return False
+
+    @staticmethod
+    def count_dropped(previous_seq, frame_seq):
+        if previous_seq >= 0 and frame_seq - previous_seq > 1:
+            FRAMES_DROPPED.inc(frame_seq - previous_seq - 1)
+
+    def actuation(self, detections, frame_time, frame, data_saver, frame_seq=-1):
+        distances_in_frame = detections["distance"]
+        if len(distances_in_frame):
+            shortest_distance = self.distance_calc.find_shortest_distance_in_frame(distances_in_frame)
+        else:
+            shortest_distance = 2000
+        self.tracker.update(detections, frame_time)
+        if self.scheduler is not None:
+            self.scheduler.report(frame_time, distances_in_frame, self.tracker)
+        self.update_leds(shortest_distance, frame_time)
+        if self.recorder is not None:
+            self.recorder.record(frame_time, detections, self.distance_to_show, self.led_val, self.time_to_collision)
+        FRAMES_PROCESSED.inc()
+        FRAME_LATENCY_SECONDS.observe(time.monotonic() - frame_time)
+
+        current_time = self.millis()
+        if (current_time - self.start_time) >= 5000:
+            self.start_time = self.millis()
+            if not self.supervisor.is_ready():
+                print("No connection to Arduino, object detection continues")
+            if data_saver and frame is not None:
+                frame = self.cam.frames.copy_frame(frame_seq, frame)
+            if data_saver and frame is not None:
+                if self.data_collected is None:
+                    self.data_collected = main.DataCollected()
+                self.data_collected.save_data(frame, self.distance_to_show, self.led_val)
+
+    def extrapolation(self, frame_time):
+        distance = self.tracker.closest_distance(frame_time)
+        self.update_leds(2000 if distance is None else distance, frame_time)
+        if self.recorder is not None:
+            self.recorder.record(frame_time, None, self.distance_to_show, self.led_val, self.time_to_collision)
+
+    def update_leds(self, shortest_distance, frame_time):
+        self.time_to_collision = self.tracker.min_time_to_collision(frame_time)
+        self.distance_to_show = self.distance_filter.update(shortest_distance)
+        led_val = self.distance_calc.map_distance_to_leds(self.distance_to_show, self.supervisor,
+                                                          self.time_to_collision, self.ttc_warning)
+        if self.led_val is None:
+            self.startup.mark("first_led")
+            self.startup.report()
+        if led_val != self.led_val:
+            LED_CHANGES.inc()
+            LED_STATE.set(comm.led_to_int(led_val))
+        self.led_val = led_val
+
     @staticmethod
     def width_bounding_box(x_min, x_max):
         width_bb = x_max - x_min
@@ -160,6 +319,15 @@ class ObjectDetection:
 
     def stop_object_detection(self):
         print("Stopped Object Detection")
+        if self.recorder is not None:
+            self.recorder.stop()
         self.cam.stop_camera()
-        cv2.destroyAllWindows()
+        if self.renderer is not None:
+            self.renderer.stop()
+        if self.supervisor is not None:
+            self.supervisor.stop()
+        if self.data_collected is not None:
+            self.data_collected.stop()
+        if self.display_mode == "window":
+            cv2.destroyAllWindows()
         self.stopped = True
@@ -0,0 +1,104 @@
+"""
+py:module::         overlay
+
+* Filename:         overlay.py
+* Description:      This module contains the drawing of the detections into the camera frames. "draw_detections"
+                     draws the bounding boxes with the class, the score and the distance of every detection.
+                     The "OverlayRenderer" class is used for the preview mode of the object detection. The detection
+                     only hands over the latest frame and its detections, the renderer copies, annotates and shows
+                     them in its own thread with a lower, configurable rate. This way the drawing and the output to
+                     the display never block the object detection.
+* Author:           Joanna Rieger
+* Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
+                      eines rückwärtigen Abstands- und Annäherungswarners"
+* E-Mail:           joanna.rieger@stud.hshl.de
+* Project Sources:
+    * Source:           https://github.com/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi
+    * Source:           https://colab.research.google.com/github/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi/blob/master/Train_TFLite2_Object_Detction_Model.ipynb
+    * Source:           https://pyimagesearch.com/2015/01/19/find-distance-camera-objectmarker-using-python-opencv/
+    * Source:           https://www.welt.de/motor/news/article244937978/Jedes-Jahr-ein-Zentimeter-mehr-Laengenwachstum-bei-Pkw.html#:~:text=Zwischen%202000%20und%202022%20ist,von%20einem%20Zentimeter%20pro%20Jahr.
+    * Source:           https://www.ardalpha.de/wissen/geschichte/kulturgeschichte/din-a4-din-normen-100-jahre-100.html#:~:text=Die%20wohl%20bekannteste%20DIN%2DNorm%20ist%20die%20DIN%20EN%20ISO,noch%20in%20den%20Drucker%20legen.
+    * Source:           https://jashuang1983.wordpress.com/rpi4-ble-with-arduino-nano-33/
+    * Source:           https://docs.arduino.cc/tutorials/nano-33-ble-sense/bluetooth/
+    * Source:           https://github.com/OpenBluetoothToolbox/SimpleBLE/blob/main/examples/simplepyble/write.py
+    * Source:           https://blog.finxter.com/5-best-ways-to-convert-python-csv-to-xml-using-elementtree/
+    * Source:           https://stackoverflow.com/questions/15679467/parse-all-the-xml-files-in-a-directory-one-by-one-using-elementtree
+    * Source:           https://chatgpt.com/
+"""
+
+# ===========================================================================================================
+# ================================================= IMPORTS =================================================
+# ===========================================================================================================
+import math
+import threading
+import time
+from threading import Thread
+import cv2
+
+
+# ===========================================================================================================
+# ================================================= CLASSES =================================================
+# ===========================================================================================================
+class OverlayRenderer:
+    def __init__(self, labels, frames=None, fps=5.0, window_name='Object detector'):
+        self.labels = labels
+        self.frames = frames
+        self.fps = fps
+        self.window_name = window_name
+        self.latest = None
+        self.stopped = False
+        self.rendered = 0
+        self.skipped = 0
+        self.lock = threading.Lock()
+        self.thread = Thread(target=self.render, daemon=True)
+        self.thread.start()
+
+    def submit(self, frame_seq, frame, detections):
+        with self.lock:
+            if self.latest is not None:
+                self.skipped += 1
+            self.latest = (frame_seq, frame, detections)
+
+    def render(self):
+        print("Preview with {} frames per second started!".format(self.fps))
+        period = 1.0 / self.fps
+        while not self.stopped:
+            start = time.monotonic()
+            with self.lock:
+                item = self.latest
+                self.latest = None
+            if item is not None:
+                frame_seq, frame, detections = item
+                frame = frame.copy()
+                if self.frames is None or self.frames.is_valid(frame_seq):
+                    draw_detections(frame, detections, self.labels)
+                    cv2.imshow(self.window_name, frame)
+                    self.rendered += 1
+            cv2.waitKey(1)
+            time.sleep(max(0.0, period - (time.monotonic() - start)))
+        cv2.destroyWindow(self.window_name)
+
+    def stop(self):
+        self.stopped = True
+
+
+# ===========================================================================================================
+# ================================================ FUNCTIONS ================================================
+# ===========================================================================================================
+def draw_detections(frame, detections, labels):
+    for detection in detections:
+        xmin, ymin = int(detection["xmin"]), int(detection["ymin"])
+        xmax, ymax = int(detection["xmax"]), int(detection["ymax"])
+
+        cv2.rectangle(frame, (xmin, ymin), (xmax, ymax), (252, 15, 192), 2)
+
+        object_name = labels[int(detection["class_id"])]
+        distance = '%dm' % detection["distance"] if math.isfinite(detection["distance"]) else '-'
+        label = '%s: %d%%, Distance: %s' % (object_name, int(detection["score"] * 100), distance)
+        label_size, base_line = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)
+        label_ymin = max(ymin, label_size[1] + 10)
+        cv2.rectangle(frame, (xmin, label_ymin - label_size[1] - 10),
+                      (xmin + label_size[0], label_ymin + base_line - 10), (255, 255, 255),
+                      cv2.FILLED)
+        cv2.putText(frame, label, (xmin, label_ymin - 7), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0),
+                    2)
@@ -0,0 +1,210 @@
+"""
+py:module::         pipeline
+
+* Filename:         pipeline.py
+* Description:      This module contains the pipeline mode of the object detection. The "DetectionPipeline" class
+                     splits the work of "ObjectDetection.object_detect" into four stages that run in their own
+                     threads: preprocessing, inference, postprocessing (distance calculation and drawing) and
+                     actuation (LED data and saving of data). The stages are connected by
+                     "DropOldestQueue" objects. These queues are bounded and drop the oldest frame when a slow stage
+                     falls behind, so the Edge TPU keeps working on new frames instead of waiting for old ones.
+                     The frames stay in the ring of the camera while they pass the stages. A frame whose slot was
+                     overwritten ("stale") is dropped after the preprocessing and is neither drawn nor saved after
+                     the postprocessing; its detections are still used, they come from the copied model input.
+                     Frames skipped by the inference scheduler go directly to the actuation. Such a frame is only
+                     extrapolated once every frame captured before it that is still in the inference has left the
+                     pipeline, so the tracker and the scheduler get every inference result in the order of capture.
+                     Only a skipped frame that is older than the last frame used is dropped, never a result.
+* Author:           Joanna Rieger
+* Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
+                      eines rückwärtigen Abstands- und Annäherungswarners"
+* E-Mail:           joanna.rieger@stud.hshl.de
+* Project Sources:
+    * Source:           https://github.com/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi
+    * Source:           https://colab.research.google.com/github/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi/blob/master/Train_TFLite2_Object_Detction_Model.ipynb
+    * Source:           https://pyimagesearch.com/2015/01/19/find-distance-camera-objectmarker-using-python-opencv/
+    * Source:           https://www.welt.de/motor/news/article244937978/Jedes-Jahr-ein-Zentimeter-mehr-Laengenwachstum-bei-Pkw.html#:~:text=Zwischen%202000%20und%202022%20ist,von%20einem%20Zentimeter%20pro%20Jahr.
+    * Source:           https://www.ardalpha.de/wissen/geschichte/kulturgeschichte/din-a4-din-normen-100-jahre-100.html#:~:text=Die%20wohl%20bekannteste%20DIN%2DNorm%20ist%20die%20DIN%20EN%20ISO,noch%20in%20den%20Drucker%20legen.
+    * Source:           https://jashuang1983.wordpress.com/rpi4-ble-with-arduino-nano-33/
+    * Source:           https://docs.arduino.cc/tutorials/nano-33-ble-sense/bluetooth/
+    * Source:           https://github.com/OpenBluetoothToolbox/SimpleBLE/blob/main/examples/simplepyble/write.py
+    * Source:           https://blog.finxter.com/5-best-ways-to-convert-python-csv-to-xml-using-elementtree/
+    * Source:           https://stackoverflow.com/questions/15679467/parse-all-the-xml-files-in-a-directory-one-by-one-using-elementtree
+    * Source:           https://chatgpt.com/
+"""
+
+# ===========================================================================================================
+# ================================================= IMPORTS =================================================
+# ===========================================================================================================
+import math
+import queue
+import sys
+import threading
+from collections import deque
+from threading import Thread
+
+sys.path.append('/home/hshl/smb-safety_system')
+from src import object_detection
+
+# Number of skipped frames that can wait for older frames in the inference, about one second of the camera.
+SKIPPED_BACKLOG = 30
+
+
+# ===========================================================================================================
+# ================================================= CLASSES =================================================
+# ===========================================================================================================
+class DropOldestQueue:
+    def __init__(self, maxsize=2, dropped_counter=None, on_drop=None):
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+        self.dropped_counter = dropped_counter
+        self.on_drop = on_drop
+        self.lock = threading.Lock()
+
+    def put(self, item):
+        with self.lock:
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        dropped_item = self.queue.get_nowait()
+                        self.dropped += 1
+                        if self.dropped_counter is not None:
+                            self.dropped_counter.inc()
+                        if self.on_drop is not None:
+                            self.on_drop(dropped_item)
+                    except queue.Empty:
+                        pass
+
+    def get(self, timeout=0.5):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class DetectionPipeline:
+    def __init__(self, ob, queue_size=2):
+        self.od = ob
+        self.stopped = False
+        # Capture times of the frames between the preprocessing and the actuation, by frame number.
+        self.in_flight = {}
+        self.in_flight_lock = threading.Lock()
+        self.preprocessed = DropOldestQueue(queue_size, object_detection.FRAMES_DROPPED, self.finished)
+        self.inferred = DropOldestQueue(queue_size, object_detection.FRAMES_DROPPED, self.finished)
+        self.postprocessed = DropOldestQueue(queue_size, object_detection.FRAMES_DROPPED, self.finished)
+        self.skipped = DropOldestQueue(SKIPPED_BACKLOG)
+        self.stale_frames = 0
+        self.threads = []
+        # One input buffer more than can be queued or be in the inference, so a buffer is never overwritten while
+        # it is still used.
+        self.input_buffers = [self.od.model_input.new_buffer() for _ in range(queue_size + 2)]
+        self.tile_buffers = [[self.od.model_input.new_buffer() for _ in self.od.tile_buffers]
+                             for _ in range(queue_size + 2)]
+
+    @staticmethod
+    def ring_slots(queue_size=2):
+        # The two queues in front of the postprocessing and the three stages reading the ring can each hold a
+        # frame of it, plus the slot the camera is writing.
+        return 2 * queue_size + 3 + 1
+
+    def run(self, data_saver, arduino):
+        self.threads = [Thread(target=self.preprocess_stage),
+                        Thread(target=self.inference_stage),
+                        Thread(target=self.postprocess_stage)]
+        for thread in self.threads:
+            thread.start()
+        self.actuation_stage(data_saver, arduino)
+        for thread in self.threads:
+            thread.join()
+        print("Dropped frames: preprocessing {}, inference {}, postprocessing {}, stale {}".format(
+            self.preprocessed.dropped, self.inferred.dropped, self.postprocessed.dropped, self.stale_frames))
+        self.od.stop_object_detection()
+
+    def preprocess_stage(self):
+        frame_seq = -1
+        buffer_index = 0
+        while not self.stopped and not self.od.stopped:
+            latest = self.od.cam.get_latest(frame_seq, timeout=0.5)
+            if latest is None:
+                if self.od.cam.stopped:
+                    self.stop()
+                continue
+            self.od.count_dropped(frame_seq, latest[0])
+            frame_seq, frame_time, frame = latest
+            if not self.od.should_infer(frame_time):
+                self.skipped.put(frame_time)
+                continue
+            input_data = self.od.preprocess(frame, frame_seq, self.input_buffers[buffer_index])
+            tile_inputs = self.od.preprocess_tiles(frame, self.tile_buffers[buffer_index])
+            if not self.od.cam.frames.is_valid(frame_seq):
+                # The camera overwrote the slot while it was read, the model input can be torn.
+                self.stale_frames += 1
+                continue
+            buffer_index = (buffer_index + 1) % len(self.input_buffers)
+            with self.in_flight_lock:
+                self.in_flight[frame_seq] = frame_time
+            self.preprocessed.put((frame_seq, frame_time, frame, input_data, tile_inputs))
+
+    def inference_stage(self):
+        while not self.stopped:
+            item = self.preprocessed.get()
+            if item is None:
+                continue
+            frame_seq, frame_time, frame, input_data, tile_inputs = item
+            boxes, classes, scores = self.od.inference(input_data)
+            tile_outputs = self.od.infer_tiles(tile_inputs)
+            self.inferred.put((frame_seq, frame_time, frame, boxes, classes, scores, tile_outputs))
+
+    def postprocess_stage(self):
+        while not self.stopped:
+            item = self.inferred.get()
+            if item is None:
+                continue
+            frame_seq, frame_time, frame, boxes, classes, scores, tile_outputs = item
+            detections = self.od.merge_tiles(self.od.postprocess(boxes, classes, scores), tile_outputs)
+            if self.od.cam.frames.is_valid(frame_seq):
+                frame = self.od.show(frame_seq, frame, detections)
+            else:
+                self.stale_frames += 1
+                frame = None
+            self.postprocessed.put((frame_seq, detections, frame_time, frame))
+
+    def actuation_stage(self, data_saver, arduino):
+        self.od.start_actuation(arduino)
+        last_frame_time = -math.inf
+        skipped_frame_times = deque(maxlen=SKIPPED_BACKLOG)
+        while not self.stopped and not self.od.stopped:
+            skipped_frame_time = self.skipped.get(timeout=0)
+            while skipped_frame_time is not None:
+                skipped_frame_times.append(skipped_frame_time)
+                skipped_frame_time = self.skipped.get(timeout=0)
+            ready = skipped_frame_times and skipped_frame_times[0] < self.oldest_in_flight()
+            item = self.postprocessed.get(timeout=0 if ready else 0.02)
+            if item is not None:
+                frame_seq, detections, frame_time, frame = item
+                self.od.actuation(detections, frame_time, frame, data_saver, frame_seq)
+                self.finished(item)
+                last_frame_time = max(last_frame_time, frame_time)
+            # Skipped frames wait for the older frames that are still in the inference.
+            oldest_in_flight = self.oldest_in_flight()
+            while skipped_frame_times and skipped_frame_times[0] < oldest_in_flight:
+                skipped_frame_time = skipped_frame_times.popleft()
+                if skipped_frame_time > last_frame_time:
+                    self.od.extrapolation(skipped_frame_time)
+                    last_frame_time = skipped_frame_time
+        self.stop()
+
+    def finished(self, item):
+        # Called with the items of all three queues, which start with the frame number.
+        with self.in_flight_lock:
+            self.in_flight.pop(item[0], None)
+
+    def oldest_in_flight(self):
+        with self.in_flight_lock:
+            return min(self.in_flight.values(), default=math.inf)
+
+    def stop(self):
+        self.stopped = True
@@ -0,0 +1,245 @@
+"""
+py:module::         recorder
+
+* Filename:         recorder.py
+* Description:      This module contains the "RideRecorder" class, which records a whole ride for a later replay.
+                     The camera stream is written into video files of "segment_seconds" seconds each, named
+                     "ride_<start time>_<segment number>". The encoding never runs in the thread of the object
+                     detection:
+                        - with the Pi camera, the hardware H.264 encoder of the Raspberry Pi encodes the main stream
+                          of "picamera2" directly into ".h264" files
+                        - otherwise (no encoder available or a recorded "FrameSource") a background thread takes the
+                          frames from the frame ring and writes them with OpenCV into ".mp4" files; it skips frames
+                          it is too slow for instead of slowing down the camera
+                     For every video segment a ".jsonl" file with one line per processed frame is written by another
+                     background thread: the capture time of the frame, the detections (class, score, box and
+                     distance), the filtered distance, the LED color and the time-to-collision. Frames on which the
+                     model did not run (see "scheduler.py") have no detections and are marked as extrapolated. The
+                     software encoder also writes the capture time of every video frame into a ".pts" file, so the
+                     lines can be matched with the video frames. The hardware encoder writes the same ".pts" files
+                     from "SegmentFileOutput": its timestamps count from the start of the encoder and are moved onto
+                     the clock of the frame ring by the smallest difference to the time the encoded frames arrive.
+                     A ".h264" file must start with a key frame, so the hardware encoder switches to the next segment
+                     at the first key frame after the segment boundary (at most one second later) instead of dropping
+                     the frames up to it.
+* Author:           Joanna Rieger
+* Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
+                      eines rückwärtigen Abstands- und Annäherungswarners"
+* E-Mail:           joanna.rieger@stud.hshl.de
+* Project Sources:
+    * Source:           https://github.com/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi
+    * Source:           https://colab.research.google.com/github/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi/blob/master/Train_TFLite2_Object_Detction_Model.ipynb
+    * Source:           https://pyimagesearch.com/2015/01/19/find-distance-camera-objectmarker-using-python-opencv/
+    * Source:           https://www.welt.de/motor/news/article244937978/Jedes-Jahr-ein-Zentimeter-mehr-Laengenwachstum-bei-Pkw.html#:~:text=Zwischen%202000%20und%202022%20ist,von%20einem%20Zentimeter%20pro%20Jahr.
+    * Source:           https://www.ardalpha.de/wissen/geschichte/kulturgeschichte/din-a4-din-normen-100-jahre-100.html#:~:text=Die%20wohl%20bekannteste%20DIN%2DNorm%20ist%20die%20DIN%20EN%20ISO,noch%20in%20den%20Drucker%20legen.
+    * Source:           https://jashuang1983.wordpress.com/rpi4-ble-with-arduino-nano-33/
+    * Source:           https://docs.arduino.cc/tutorials/nano-33-ble-sense/bluetooth/
+    * Source:           https://github.com/OpenBluetoothToolbox/SimpleBLE/blob/main/examples/simplepyble/write.py
+    * Source:           https://blog.finxter.com/5-best-ways-to-convert-python-csv-to-xml-using-elementtree/
+    * Source:           https://stackoverflow.com/questions/15679467/parse-all-the-xml-files-in-a-directory-one-by-one-using-elementtree
+    * Source:           https://chatgpt.com/
+"""
+
+# ===========================================================================================================
+# ================================================= IMPORTS =================================================
+# ===========================================================================================================
+import json
+import math
+import os
+import queue
+import time
+from datetime import datetime
+from threading import Thread
+import cv2
+
+try:
+    from picamera2.outputs import FileOutput
+except ImportError:
+    FileOutput = object
+
+# Number of metadata lines that can wait for the writer before new lines are dropped.
+METADATA_QUEUE_SIZE = 256
+
+
+# ===========================================================================================================
+# ================================================= CLASSES =================================================
+# ===========================================================================================================
+class RideRecorder:
+    def __init__(self, frame_source, directory, segment_seconds=60.0, fps=30.0, labels=None):
+        self.frame_source = frame_source
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.fps = getattr(frame_source, "fps", fps)
+        self.labels = labels
+        self.name = "ride_" + datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        self.start_time = time.monotonic()
+        self.metadata = queue.Queue(METADATA_QUEUE_SIZE)
+        self.stopped = False
+        self.frames_written = 0
+        self.frames_skipped = 0
+        self.lines_dropped = 0
+        self.encoder = None
+        self.output = None
+        self.threads = []
+
+        os.makedirs(self.directory, exist_ok=True)
+        if not self.start_hardware_encoder():
+            self.threads.append(Thread(target=self.encode, daemon=True))
+        self.threads.append(Thread(target=self.write_metadata, daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def segment(self, timestamp):
+        return max(0, int((timestamp - self.start_time) // self.segment_seconds))
+
+    def segment_path(self, segment, extension):
+        return os.path.join(self.directory, "{}_{:04d}{}".format(self.name, segment, extension))
+
+    def start_hardware_encoder(self):
+        picam2 = getattr(self.frame_source, "picam2", None)
+        if picam2 is None:
+            return False
+        try:
+            from picamera2.encoders import H264Encoder
+            # A key frame every second and the stream headers repeated with it, so every segment can be decoded
+            # on its own.
+            self.encoder = H264Encoder(repeat=True, iperiod=max(1, int(self.fps)))
+            self.output = SegmentFileOutput(self)
+            picam2.start_encoder(self.encoder, self.output)
+        except Exception as e:
+            print("Hardware encoder not available, frames are encoded in software: {}".format(e))
+            self.encoder = None
+            self.output = None
+            return False
+        print("Recording with the hardware encoder to {}".format(self.directory))
+        return True
+
+    def encode(self):
+        print("Recording with the software encoder to {}".format(self.directory))
+        frames = self.frame_source.frames
+        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+        frame_seq = -1
+        segment = None
+        writer = None
+        pts_file = None
+        while not self.stopped:
+            # Not acknowledged, so a recorded source still waits for the object detection and not for the recorder.
+            latest = frames.get_latest(frame_seq, timeout=0.5, acknowledge=False)
+            if latest is None:
+                if frames.stopped:
+                    break
+                continue
+            if frame_seq >= 0:
+                self.frames_skipped += latest[0] - frame_seq - 1
+            frame_seq, frame_time, frame = latest
+            frame = frame.copy()
+            if not frames.is_valid(frame_seq):
+                self.frames_skipped += 1
+                continue
+            if self.segment(frame_time) != segment:
+                if writer is not None:
+                    writer.release()
+                    pts_file.close()
+                segment = self.segment(frame_time)
+                height, width = frame.shape[:2]
+                writer = cv2.VideoWriter(self.segment_path(segment, ".mp4"), fourcc, self.fps, (width, height))
+                pts_file = open(self.segment_path(segment, ".pts"), "w")
+            writer.write(frame)
+            pts_file.write("{:.6f}\n".format(frame_time))
+            self.frames_written += 1
+        if writer is not None:
+            writer.release()
+            pts_file.close()
+
+    def record(self, frame_time, detections, distance, led, time_to_collision):
+        line = {"t": round(frame_time, 6),
+                "distance": rounded(distance),
+                "led": led,
+                "ttc": rounded(time_to_collision)}
+        if detections is None:
+            line["extrapolated"] = True
+        else:
+            line["detections"] = [[self.label(detection["class_id"]), round(float(detection["score"]), 3),
+                                   int(detection["xmin"]), int(detection["ymin"]),
+                                   int(detection["xmax"]), int(detection["ymax"]),
+                                   rounded(detection["distance"])]
+                                  for detection in detections]
+        try:
+            self.metadata.put_nowait(line)
+        except queue.Full:
+            self.lines_dropped += 1
+
+    def label(self, class_id):
+        if self.labels is None:
+            return int(class_id)
+        return self.labels[int(class_id)]
+
+    def write_metadata(self):
+        segment = None
+        metadata_file = None
+        while not (self.stopped and self.metadata.empty()):
+            try:
+                line = self.metadata.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if self.segment(line["t"]) != segment:
+                if metadata_file is not None:
+                    metadata_file.close()
+                segment = self.segment(line["t"])
+                metadata_file = open(self.segment_path(segment, ".jsonl"), "a")
+            metadata_file.write(json.dumps(line, separators=(",", ":")) + "\n")
+        if metadata_file is not None:
+            metadata_file.close()
+
+    def stop(self):
+        self.stopped = True
+        if self.encoder is not None:
+            try:
+                self.frame_source.picam2.stop_encoder()
+            except Exception as e:
+                print("Stopping the hardware encoder failed: {}".format(e))
+        for thread in self.threads:
+            thread.join(2.0)
+        print("Recording stopped: {} frames written, {} frames skipped, {} metadata lines dropped".format(
+            self.frames_written, self.frames_skipped, self.lines_dropped))
+
+
+class SegmentFileOutput(FileOutput):
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.segment = 0
+        self.anchor = None
+        super().__init__(recorder.segment_path(0, ".h264"))
+        self.pts_file = open(recorder.segment_path(0, ".pts"), "w")
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, *args, **kwargs):
+        # Called in the thread of the encoder, so the file is never switched while a frame is written.
+        if timestamp is not None:
+            anchor = time.monotonic() - timestamp / 1e6
+            self.anchor = anchor if self.anchor is None else min(self.anchor, anchor)
+            frame_time = self.anchor + timestamp / 1e6
+            if keyframe and self.recorder.segment(frame_time) > self.segment:
+                self.segment = self.recorder.segment(frame_time)
+                self.close()
+                self.fileoutput = self.recorder.segment_path(self.segment, ".h264")
+                self.pts_file.close()
+                self.pts_file = open(self.recorder.segment_path(self.segment, ".pts"), "w")
+            self.pts_file.write("{:.6f}\n".format(frame_time))
+        super().outputframe(frame, keyframe, timestamp, *args, **kwargs)
+        self.recorder.frames_written += 1
+
+    def stop(self):
+        super().stop()
+        self.pts_file.close()
+
+
+# ===========================================================================================================
+# ================================================ FUNCTIONS ================================================
+# ===========================================================================================================
+def rounded(value, digits=2):
+    if value is None:
+        return None
+    value = float(value)
+    if not math.isfinite(value):
+        return None
+    return round(value, digits)
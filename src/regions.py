@@ -0,0 +1,129 @@
+"""
+py:module::         regions
+
+* Filename:         regions.py
+* Description:      This module contains the regions of the camera frame the object detection model is run on.
+                     "to_region" turns the configured bounds of the road ("region of interest") into a pixel
+                     rectangle (x, y, width, height). Only this part of the frame is cropped and resized to the input
+                     size of the model, so the sky and the own bicycle do not take pixels away from the vehicles.
+                     A vehicle 50 m behind the bicycle is only a few pixels wide in the whole, squeezed frame. The
+                     "TilePlanner" therefore covers the far field, the part of the road where distant vehicles
+                     appear, with overlapping tiles of the input size of the model in full camera resolution. As
+                     every tile costs one more inference, "next_tiles" only hands out "budget" tiles per frame and
+                     goes through all tiles in turn over the following frames.
+                     The detections of a tile are decoded into coordinates of the full frame, detections cut by an
+                     inner edge of their tile are removed with "complete" and "merge_detections" removes the
+                     detections of a vehicle that was found more than once. The width of the bounding box and the
+                     distance are therefore always calculated in full frame pixels.
+* Author:           Joanna Rieger
+* Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
+                      eines rückwärtigen Abstands- und Annäherungswarners"
+* E-Mail:           joanna.rieger@stud.hshl.de
+* Project Sources:
+    * Source:           https://github.com/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi
+    * Source:           https://colab.research.google.com/github/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi/blob/master/Train_TFLite2_Object_Detction_Model.ipynb
+    * Source:           https://pyimagesearch.com/2015/01/19/find-distance-camera-objectmarker-using-python-opencv/
+    * Source:           https://www.welt.de/motor/news/article244937978/Jedes-Jahr-ein-Zentimeter-mehr-Laengenwachstum-bei-Pkw.html#:~:text=Zwischen%202000%20und%202022%20ist,von%20einem%20Zentimeter%20pro%20Jahr.
+    * Source:           https://www.ardalpha.de/wissen/geschichte/kulturgeschichte/din-a4-din-normen-100-jahre-100.html#:~:text=Die%20wohl%20bekannteste%20DIN%2DNorm%20ist%20die%20DIN%20EN%20ISO,noch%20in%20den%20Drucker%20legen.
+    * Source:           https://jashuang1983.wordpress.com/rpi4-ble-with-arduino-nano-33/
+    * Source:           https://docs.arduino.cc/tutorials/nano-33-ble-sense/bluetooth/
+    * Source:           https://github.com/OpenBluetoothToolbox/SimpleBLE/blob/main/examples/simplepyble/write.py
+    * Source:           https://blog.finxter.com/5-best-ways-to-convert-python-csv-to-xml-using-elementtree/
+    * Source:           https://stackoverflow.com/questions/15679467/parse-all-the-xml-files-in-a-directory-one-by-one-using-elementtree
+    * Source:           https://chatgpt.com/
+"""
+
+# ===========================================================================================================
+# ================================================= IMPORTS =================================================
+# ===========================================================================================================
+import math
+import sys
+import numpy as np
+
+sys.path.append('/home/hshl/smb-safety_system')
+from src import tracking
+
+
+# ===========================================================================================================
+# ================================================= CLASSES =================================================
+# ===========================================================================================================
+class TilePlanner:
+    def __init__(self, far_field, resolution, tile_size, budget=1, overlap=0.2, edge_margin=2):
+        self.im_w, self.im_h = int(resolution[0]), int(resolution[1])
+        self.far_field = to_region(far_field, resolution)
+        self.tile_w = min(int(tile_size[0]), self.im_w)
+        self.tile_h = min(int(tile_size[1]), self.im_h)
+        self.budget = budget
+        self.overlap = overlap
+        self.edge_margin = edge_margin
+        self.tiles = [(x, y, self.tile_w, self.tile_h)
+                      for y in self.positions(self.far_field[1], self.far_field[3], self.tile_h, self.im_h)
+                      for x in self.positions(self.far_field[0], self.far_field[2], self.tile_w, self.im_w)]
+        self.next_index = 0
+        print("Far field {} covered by {} tiles, {} per frame".format(self.far_field, len(self.tiles),
+                                                                      min(self.budget, len(self.tiles))))
+
+    def positions(self, start, length, tile, frame):
+        if length <= tile:
+            # A far field smaller than a tile gets one tile around its center, kept inside the frame.
+            return [min(max(0, start + (length - tile) // 2), frame - tile)]
+        count = math.ceil((length - tile) / (tile * (1.0 - self.overlap))) + 1
+        return [int(round(position)) for position in np.linspace(start, start + length - tile, count)]
+
+    def next_tiles(self):
+        count = min(self.budget, len(self.tiles))
+        tiles = [self.tiles[(self.next_index + i) % len(self.tiles)] for i in range(count)]
+        self.next_index = (self.next_index + count) % len(self.tiles)
+        return tiles
+
+    def complete(self, detections, tile):
+        # A vehicle cut by an inner edge of the tile would get a too small width and a too large distance. It is
+        # seen completely by the neighboring tile or the region of interest.
+        x, y, w, h = tile
+        keep = np.ones(len(detections), dtype=bool)
+        if x > 0:
+            keep &= detections["xmin"] > x + self.edge_margin
+        if x + w < self.im_w:
+            keep &= detections["xmax"] < x + w - self.edge_margin
+        if y > 0:
+            keep &= detections["ymin"] > y + self.edge_margin
+        if y + h < self.im_h:
+            keep &= detections["ymax"] < y + h - self.edge_margin
+        return detections[keep]
+
+
+# ===========================================================================================================
+# ================================================ FUNCTIONS ================================================
+# ===========================================================================================================
+def parse_bounds(text):
+    bounds = tuple(float(value) for value in text.split(","))
+    if len(bounds) != 4 or not 0.0 <= bounds[0] < bounds[2] <= 1.0 or not 0.0 <= bounds[1] < bounds[3] <= 1.0:
+        raise ValueError("Bounds must be x_min,y_min,x_max,y_max between 0 and 1, not {}".format(text))
+    return bounds
+
+
+def to_region(bounds, resolution):
+    x_min = int(round(bounds[0] * resolution[0]))
+    y_min = int(round(bounds[1] * resolution[1]))
+    x_max = int(round(bounds[2] * resolution[0]))
+    y_max = int(round(bounds[3] * resolution[1]))
+    return x_min, y_min, max(1, x_max - x_min), max(1, y_max - y_min)
+
+
+def crop(frame, region):
+    x, y, w, h = region
+    return frame[y:y + h, x:x + w]
+
+
+def merge_detections(detection_sets, iou_threshold=0.5):
+    detections = np.concatenate(detection_sets)
+    if len(detections) < 2:
+        return detections
+    # The same vehicle found in the region of interest and in a tile keeps only its detection with the higher
+    # score, independent of the class.
+    boxes = [tracking.box_of(detection) for detection in detections]
+    kept = []
+    for index in np.argsort(-detections["score"], kind="stable"):
+        if all(tracking.iou(boxes[index], boxes[other]) < iou_threshold for other in kept):
+            kept.append(index)
+    return detections[np.sort(kept)]
@@ -0,0 +1,98 @@
+"""
+py:module::         scheduler
+
+* Filename:         scheduler.py
+* Description:      This module contains the "InferenceScheduler" class. It decides for every camera frame whether the
+                     object detection model is run on it, depending on what is currently happening behind the
+                     bicycle:
+                        "alert": a vehicle is inside the yellow or red distance band or approaches fast
+                                 -> the model runs on every frame
+                        "watch": a vehicle was seen within the last "idle_after" seconds
+                                 -> the model runs at least every "watch_interval" seconds
+                        "idle":  nothing was seen for "idle_after" seconds
+                                 -> the model runs every "idle_interval" seconds
+                     "idle_interval" is therefore the longest time a new vehicle can stay undetected. On the frames
+                     without inference the tracker extrapolates the distances of the known vehicles. This reduces the
+                     load and heat of the CPU and the Edge TPU on long empty roads.
+* Author:           Joanna Rieger
+* Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
+                      eines rückwärtigen Abstands- und Annäherungswarners"
+* E-Mail:           joanna.rieger@stud.hshl.de
+* Project Sources:
+    * Source:           https://github.com/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi
+    * Source:           https://colab.research.google.com/github/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi/blob/master/Train_TFLite2_Object_Detction_Model.ipynb
+    * Source:           https://pyimagesearch.com/2015/01/19/find-distance-camera-objectmarker-using-python-opencv/
+    * Source:           https://www.welt.de/motor/news/article244937978/Jedes-Jahr-ein-Zentimeter-mehr-Laengenwachstum-bei-Pkw.html#:~:text=Zwischen%202000%20und%202022%20ist,von%20einem%20Zentimeter%20pro%20Jahr.
+    * Source:           https://www.ardalpha.de/wissen/geschichte/kulturgeschichte/din-a4-din-normen-100-jahre-100.html#:~:text=Die%20wohl%20bekannteste%20DIN%2DNorm%20ist%20die%20DIN%20EN%20ISO,noch%20in%20den%20Drucker%20legen.
+    * Source:           https://jashuang1983.wordpress.com/rpi4-ble-with-arduino-nano-33/
+    * Source:           https://docs.arduino.cc/tutorials/nano-33-ble-sense/bluetooth/
+    * Source:           https://github.com/OpenBluetoothToolbox/SimpleBLE/blob/main/examples/simplepyble/write.py
+    * Source:           https://blog.finxter.com/5-best-ways-to-convert-python-csv-to-xml-using-elementtree/
+    * Source:           https://stackoverflow.com/questions/15679467/parse-all-the-xml-files-in-a-directory-one-by-one-using-elementtree
+    * Source:           https://chatgpt.com/
+"""
+
+# ===========================================================================================================
+# ================================================= IMPORTS =================================================
+# ===========================================================================================================
+import sys
+import threading
+
+sys.path.append('/home/hshl/smb-safety_system')
+from src import mapping
+
+
+# ===========================================================================================================
+# ================================================= CLASSES =================================================
+# ===========================================================================================================
+class InferenceScheduler:
+    def __init__(self, idle_interval=0.5, watch_interval=0.1, idle_after=3.0,
+                 alert_distance=None, closing_speed=2.0):
+        # Looked up here and not as default value, because "mapping" is still being imported when it imports "main".
+        if alert_distance is None:
+            alert_distance = mapping.YELLOW_DISTANCE
+        self.idle_interval = idle_interval
+        self.watch_interval = watch_interval
+        self.idle_after = idle_after
+        self.alert_distance = alert_distance
+        self.closing_speed = closing_speed
+        self.state = "alert"
+        self.last_inference = None
+        self.last_seen = None
+        self.inferred = 0
+        self.skipped = 0
+        # "should_infer" and "report" are called from different threads in the pipeline mode.
+        self.lock = threading.Lock()
+
+    def interval(self):
+        if self.state == "alert":
+            return 0.0
+        if self.state == "watch":
+            return self.watch_interval
+        return self.idle_interval
+
+    def should_infer(self, timestamp):
+        with self.lock:
+            if self.last_inference is None or timestamp - self.last_inference >= self.interval():
+                self.last_inference = timestamp
+                self.inferred += 1
+                return True
+            self.skipped += 1
+            return False
+
+    def report(self, timestamp, distances, tracker=None):
+        tracks = tracker.confirmed_tracks() if tracker is not None else []
+        closing = any(track.approach_speed() > self.closing_speed for track in tracks)
+        near = any(distance < self.alert_distance for distance in distances)
+        with self.lock:
+            if len(distances) or self.last_seen is None:
+                self.last_seen = timestamp
+            if near or closing:
+                state = "alert"
+            elif timestamp - self.last_seen < self.idle_after:
+                state = "watch"
+            else:
+                state = "idle"
+            if state != self.state:
+                print("Inference scheduler: {} -> {}".format(self.state, state))
+                self.state = state
@@ -35,7 +35,7 @@
 #define CHARACTERISTIC_UUID "12345678-1234-5678-1234-56789abcdef1"
 
 BLEService bleService(SERVICE_UUID);
-BLEIntCharacteristic led_characteristic(CHARACTERISTIC_UUID, BLERead | BLEWrite);
+BLEIntCharacteristic led_characteristic(CHARACTERISTIC_UUID, BLERead | BLEWrite | BLEWriteWithoutResponse);
 
 int ledPin[] = { 3, 4, 5 };
 int pins = sizeof(ledPin) / sizeof(ledPin[0]);
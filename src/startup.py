@@ -0,0 +1,95 @@
+"""
+py:module::         startup
+
+* Filename:         startup.py
+* Description:      This module contains the "StartupReport" class, which measures the cold start of the system.
+                     The stages of the start (BLE connection, loading the model, warm-up inference, camera) run at
+                     the same time. "stage" measures a stage in the calling thread, "submit" runs a stage in a
+                     background thread and returns a future with its result, and "mark" records a single event,
+                     e.g. the first LED value. All times are counted from the creation of the report, i.e. the start
+                     of the program. "report" prints when every stage started and ended, the times are also exported
+                     as "startup_<stage>_seconds" by the "metrics" module.
+* Author:           Joanna Rieger
+* Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
+                      eines rückwärtigen Abstands- und Annäherungswarners"
+* E-Mail:           joanna.rieger@stud.hshl.de
+* Project Sources:
+    * Source:           https://github.com/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi
+    * Source:           https://colab.research.google.com/github/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi/blob/master/Train_TFLite2_Object_Detction_Model.ipynb
+    * Source:           https://pyimagesearch.com/2015/01/19/find-distance-camera-objectmarker-using-python-opencv/
+    * Source:           https://www.welt.de/motor/news/article244937978/Jedes-Jahr-ein-Zentimeter-mehr-Laengenwachstum-bei-Pkw.html#:~:text=Zwischen%202000%20und%202022%20ist,von%20einem%20Zentimeter%20pro%20Jahr.
+    * Source:           https://www.ardalpha.de/wissen/geschichte/kulturgeschichte/din-a4-din-normen-100-jahre-100.html#:~:text=Die%20wohl%20bekannteste%20DIN%2DNorm%20ist%20die%20DIN%20EN%20ISO,noch%20in%20den%20Drucker%20legen.
+    * Source:           https://jashuang1983.wordpress.com/rpi4-ble-with-arduino-nano-33/
+    * Source:           https://docs.arduino.cc/tutorials/nano-33-ble-sense/bluetooth/
+    * Source:           https://github.com/OpenBluetoothToolbox/SimpleBLE/blob/main/examples/simplepyble/write.py
+    * Source:           https://blog.finxter.com/5-best-ways-to-convert-python-csv-to-xml-using-elementtree/
+    * Source:           https://stackoverflow.com/questions/15679467/parse-all-the-xml-files-in-a-directory-one-by-one-using-elementtree
+    * Source:           https://chatgpt.com/
+"""
+
+# ===========================================================================================================
+# ================================================= IMPORTS =================================================
+# ===========================================================================================================
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+sys.path.append('/home/hshl/smb-safety_system')
+from src import metrics
+
+
+# ===========================================================================================================
+# ================================================= CLASSES =================================================
+# ===========================================================================================================
+class StartupReport:
+    def __init__(self, start=None):
+        self.start = time.monotonic() if start is None else start
+        self.stages = {}
+        self.reported = False
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=4)
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    @contextmanager
+    def stage(self, name):
+        begin = self.elapsed()
+        try:
+            yield
+        finally:
+            self.record(name, begin, self.elapsed())
+
+    def submit(self, name, function, *args):
+        def run():
+            with self.stage(name):
+                return function(*args)
+        return self.executor.submit(run)
+
+    def mark(self, name):
+        # Only the first occurrence of an event belongs to the start, e.g. the first of several BLE connections.
+        with self.lock:
+            if name in self.stages:
+                return False
+        self.record(name, 0.0, self.elapsed())
+        print("Startup: {} after {:.2f} s".format(name, self.stages[name][1]))
+        return True
+
+    def record(self, name, begin, end):
+        with self.lock:
+            self.stages[name] = (begin, end)
+        metrics.registry.gauge("startup_{}_seconds".format(name),
+                               "Seconds from the start of the program until the end of the stage " + name).set(end)
+
+    def report(self):
+        with self.lock:
+            if self.reported:
+                return
+            self.reported = True
+            stages = sorted(self.stages.items(), key=lambda item: item[1][1])
+        print("Startup [s]          begin       end  duration")
+        for name, (begin, end) in stages:
+            print("{:<16}{:>10.2f}{:>10.2f}{:>10.2f}".format(name, begin, end, end - begin))
+        self.executor.shutdown(wait=False)
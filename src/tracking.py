@@ -0,0 +1,209 @@
+"""
+py:module::         tracking
+
+* Filename:         tracking.py
+* Description:      This module contains a lightweight multi-object tracker for the decoded detections. The
+                     "DetectionTracker" class links the detections of a frame to the tracks of the previous frames by
+                     the overlap of the bounding boxes (IoU) or, if they do not overlap, by the distance of their
+                     centers. Every "Track" has an id and smooths its distance with an alpha filter. The approach
+                     speed is the slope of a least-squares line through the measured distances of the last
+                     "speed_window" seconds: a change of the bounding box width by one pixel changes the distance of
+                     a far vehicle by a meter, so the speed of two successive frames would be dominated by this
+                     jitter. The time until the vehicle reaches the bicycle (time-to-collision) is only given for
+                     tracks that exist for "min_age" seconds and approached in the last "min_approach_updates"
+                     updates, and only up to "max_distance", the distance up to which the width still resolves the
+                     speed. Between two inference runs the tracker can extrapolate the distances of all tracks to the
+                     current time, so the object detection can run less often without losing warnings.
+* Author:           Joanna Rieger
+* Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
+                      eines rückwärtigen Abstands- und Annäherungswarners"
+* E-Mail:           joanna.rieger@stud.hshl.de
+* Project Sources:
+    * Source:           https://github.com/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi
+    * Source:           https://colab.research.google.com/github/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi/blob/master/Train_TFLite2_Object_Detction_Model.ipynb
+    * Source:           https://pyimagesearch.com/2015/01/19/find-distance-camera-objectmarker-using-python-opencv/
+    * Source:           https://www.welt.de/motor/news/article244937978/Jedes-Jahr-ein-Zentimeter-mehr-Laengenwachstum-bei-Pkw.html#:~:text=Zwischen%202000%20und%202022%20ist,von%20einem%20Zentimeter%20pro%20Jahr.
+    * Source:           https://www.ardalpha.de/wissen/geschichte/kulturgeschichte/din-a4-din-normen-100-jahre-100.html#:~:text=Die%20wohl%20bekannteste%20DIN%2DNorm%20ist%20die%20DIN%20EN%20ISO,noch%20in%20den%20Drucker%20legen.
+    * Source:           https://jashuang1983.wordpress.com/rpi4-ble-with-arduino-nano-33/
+    * Source:           https://docs.arduino.cc/tutorials/nano-33-ble-sense/bluetooth/
+    * Source:           https://github.com/OpenBluetoothToolbox/SimpleBLE/blob/main/examples/simplepyble/write.py
+    * Source:           https://blog.finxter.com/5-best-ways-to-convert-python-csv-to-xml-using-elementtree/
+    * Source:           https://stackoverflow.com/questions/15679467/parse-all-the-xml-files-in-a-directory-one-by-one-using-elementtree
+    * Source:           https://chatgpt.com/
+"""
+
+# ===========================================================================================================
+# ================================================= IMPORTS =================================================
+# ===========================================================================================================
+import itertools
+import math
+from collections import deque
+
+
+# ===========================================================================================================
+# ================================================= CLASSES =================================================
+# ===========================================================================================================
+class Track:
+    def __init__(self, track_id, detection, timestamp, speed_window=1.0):
+        self.track_id = track_id
+        self.box = box_of(detection)
+        self.class_id = int(detection["class_id"])
+        self.distance = float(detection["distance"])
+        self.speed = 0.0
+        self.speed_window = speed_window
+        self.measurements = deque([(timestamp, self.distance)])
+        self.first_update = timestamp
+        self.last_update = timestamp
+        self.hits = 1
+        self.misses = 0
+        self.approach_updates = 0
+
+    def predict_distance(self, timestamp):
+        return self.distance + self.speed * (timestamp - self.last_update)
+
+    def update(self, detection, timestamp, alpha, min_speed=0.5):
+        dt = timestamp - self.last_update
+        self.box = box_of(detection)
+        self.class_id = int(detection["class_id"])
+        measured = float(detection["distance"])
+        if math.isfinite(measured):
+            self.measurements.append((timestamp, measured))
+            while timestamp - self.measurements[0][0] > self.speed_window:
+                self.measurements.popleft()
+            self.speed = self.fit_speed()
+            if dt <= 0:
+                self.distance = measured
+            else:
+                predicted = self.distance + self.speed * dt
+                self.distance = predicted + alpha * (measured - predicted)
+        self.last_update = timestamp
+        self.hits += 1
+        self.misses = 0
+        self.approach_updates = self.approach_updates + 1 if self.approach_speed() >= min_speed else 0
+
+    def fit_speed(self, min_measurements=3):
+        if len(self.measurements) < min_measurements:
+            return 0.0
+        times = [timestamp - self.measurements[0][0] for timestamp, _ in self.measurements]
+        mean_time = sum(times) / len(times)
+        mean_distance = sum(distance for _, distance in self.measurements) / len(self.measurements)
+        variance = sum((time - mean_time) ** 2 for time in times)
+        if variance <= 0:
+            return 0.0
+        covariance = sum((time - mean_time) * (distance - mean_distance)
+                         for time, (_, distance) in zip(times, self.measurements))
+        return covariance / variance
+
+    def approach_speed(self):
+        return -self.speed
+
+    def age(self, timestamp=None):
+        return (self.last_update if timestamp is None else timestamp) - self.first_update
+
+    def time_to_collision(self, timestamp=None, min_speed=0.5, min_age=0.5, min_approach_updates=5):
+        distance = self.distance if timestamp is None else self.predict_distance(timestamp)
+        if self.age(timestamp) < min_age or self.approach_updates < min_approach_updates:
+            return math.inf
+        if self.approach_speed() < min_speed:
+            return math.inf
+        return max(0.0, distance) / self.approach_speed()
+
+
+class DetectionTracker:
+    def __init__(self, min_iou=0.2, max_center_distance=80, max_age=1.0, min_hits=2, alpha=0.5, speed_window=1.0,
+                 min_speed=0.5, min_ttc_age=0.5, min_approach_updates=5, max_distance=40.0):
+        self.min_iou = min_iou
+        self.max_center_distance = max_center_distance
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.alpha = alpha
+        self.speed_window = speed_window
+        self.min_speed = min_speed
+        self.min_ttc_age = min_ttc_age
+        self.min_approach_updates = min_approach_updates
+        self.max_distance = max_distance
+        self.tracks = []
+        self.ids = itertools.count(1)
+
+    def update(self, detections, timestamp):
+        pairs = []
+        for t, track in enumerate(self.tracks):
+            for d, detection in enumerate(detections):
+                box = box_of(detection)
+                overlap = iou(track.box, box)
+                if overlap >= self.min_iou:
+                    pairs.append((1.0 + overlap, t, d))
+                    continue
+                center_distance = distance_of_centers(track.box, box)
+                if center_distance <= self.max_center_distance:
+                    pairs.append((1.0 - center_distance / self.max_center_distance, t, d))
+        pairs.sort(reverse=True)
+
+        matched_tracks = set()
+        matched_detections = set()
+        for _, t, d in pairs:
+            if t in matched_tracks or d in matched_detections:
+                continue
+            self.tracks[t].update(detections[d], timestamp, self.alpha, self.min_speed)
+            matched_tracks.add(t)
+            matched_detections.add(d)
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+        for d, detection in enumerate(detections):
+            if d not in matched_detections and math.isfinite(float(detection["distance"])):
+                self.tracks.append(Track(next(self.ids), detection, timestamp, self.speed_window))
+        self.tracks = [track for track in self.tracks if timestamp - track.last_update <= self.max_age]
+        return self.confirmed_tracks()
+
+    def confirmed_tracks(self):
+        return [track for track in self.tracks if track.hits >= self.min_hits]
+
+    def predict(self, timestamp):
+        predictions = []
+        for track in self.confirmed_tracks():
+            distance = track.predict_distance(timestamp)
+            time_to_collision = math.inf
+            # Beyond "max_distance" a pixel of the bounding box width is too large a step of the distance to
+            # measure the speed.
+            if distance <= self.max_distance:
+                time_to_collision = track.time_to_collision(timestamp, self.min_speed, self.min_ttc_age,
+                                                            self.min_approach_updates)
+            predictions.append((track.track_id, distance, time_to_collision))
+        return predictions
+
+    def closest_distance(self, timestamp):
+        distances = [distance for _, distance, _ in self.predict(timestamp)]
+        return min(distances) if distances else None
+
+    def min_time_to_collision(self, timestamp):
+        times = [ttc for _, _, ttc in self.predict(timestamp)]
+        return min(times) if times else math.inf
+
+    def reset(self):
+        self.tracks = []
+
+
+# ===========================================================================================================
+# ================================================ FUNCTIONS ================================================
+# ===========================================================================================================
+def box_of(detection):
+    return (int(detection["xmin"]), int(detection["ymin"]), int(detection["xmax"]), int(detection["ymax"]))
+
+
+def iou(box_a, box_b):
+    x_left = max(box_a[0], box_b[0])
+    y_top = max(box_a[1], box_b[1])
+    x_right = min(box_a[2], box_b[2])
+    y_bottom = min(box_a[3], box_b[3])
+    intersection = max(0, x_right - x_left) * max(0, y_bottom - y_top)
+    area_a = max(0, box_a[2] - box_a[0]) * max(0, box_a[3] - box_a[1])
+    area_b = max(0, box_b[2] - box_b[0]) * max(0, box_b[3] - box_b[1])
+    union = area_a + area_b - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def distance_of_centers(box_a, box_b):
+    return math.hypot((box_a[0] + box_a[2] - box_b[0] - box_b[2]) / 2,
+                      (box_a[1] + box_a[3] - box_b[1] - box_b[3]) / 2)
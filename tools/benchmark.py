@@ -0,0 +1,299 @@
+"""
+py:module::         benchmark
+
+* Filename:         benchmark.py
+* Description:      This module measures the object detection on recorded input without the Raspberry Pi camera, the
+                     Edge TPU or the Arduino. "ObjectDetection" reads the frames of a video file, a directory of JPEG
+                     images or a .npy frame dump (see "frame_source.py") as fast as it can process them. The model is
+                     replaced by the "stub" backend (see "backends.py"), which returns a car approaching the bicycle
+                     after a configurable inference time, and the Arduino by the "FakeArduino", which records every
+                     LED write.
+                     The time of every stage is measured for every frame:
+                        "capture":     waiting for the next frame of the source
+                        "preprocess":  "cvtColor" and "resize"
+                        "inference":   "interpreter.invoke()" and reading the output tensors
+                        "decode":      decoding of the boxes and the distance of every detection
+                        "distance":    shortest distance, tracking, distance filter and LED selection
+                        "draw":        drawing of the detections into a copy of the frame (only with --draw)
+                        "ble_write":   write of the LED value to the Arduino
+                        "end_to_end":  capture of a frame until its LED value is selected, including the time the
+                                       frame waits in the ring while the previous frame is processed
+                        "frame_to_led": capture of a frame until the LED color it caused is written to the Arduino
+                     The frames per second and count, mean, p50, p95, p99 and maximum of every stage in milliseconds
+                     are printed and written into a JSON file together with the git commit, so the results of two
+                     commits can be compared with --compare.
+                     With "--backend edgetpu" or "--backend cpu" the real model is used instead of the stub.
+* Author:           Joanna Rieger
+* Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
+                      eines rückwärtigen Abstands- und Annäherungswarners"
+* E-Mail:           joanna.rieger@stud.hshl.de
+* Project Sources:
+    * Source:           https://github.com/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi
+    * Source:           https://colab.research.google.com/github/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi/blob/master/Train_TFLite2_Object_Detction_Model.ipynb
+    * Source:           https://pyimagesearch.com/2015/01/19/find-distance-camera-objectmarker-using-python-opencv/
+    * Source:           https://www.welt.de/motor/news/article244937978/Jedes-Jahr-ein-Zentimeter-mehr-Laengenwachstum-bei-Pkw.html#:~:text=Zwischen%202000%20und%202022%20ist,von%20einem%20Zentimeter%20pro%20Jahr.
+    * Source:           https://www.ardalpha.de/wissen/geschichte/kulturgeschichte/din-a4-din-normen-100-jahre-100.html#:~:text=Die%20wohl%20bekannteste%20DIN%2DNorm%20ist%20die%20DIN%20EN%20ISO,noch%20in%20den%20Drucker%20legen.
+    * Source:           https://jashuang1983.wordpress.com/rpi4-ble-with-arduino-nano-33/
+    * Source:           https://docs.arduino.cc/tutorials/nano-33-ble-sense/bluetooth/
+    * Source:           https://github.com/OpenBluetoothToolbox/SimpleBLE/blob/main/examples/simplepyble/write.py
+    * Source:           https://blog.finxter.com/5-best-ways-to-convert-python-csv-to-xml-using-elementtree/
+    * Source:           https://stackoverflow.com/questions/15679467/parse-all-the-xml-files-in-a-directory-one-by-one-using-elementtree
+    * Source:           https://chatgpt.com/
+"""
+
+# ===========================================================================================================
+# ================================================= IMPORTS =================================================
+# ===========================================================================================================
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+import numpy as np
+
+sys.path.append('/home/hshl/smb-safety_system')
+from src import backends
+from src import frame_source
+from src import object_detection
+from src import overlay
+from src import regions
+
+
+# ===========================================================================================================
+# ================================================= CLASSES =================================================
+# ===========================================================================================================
+class FakeArduino:
+    def __init__(self, write_ms=0.0, on_write=None):
+        self.write_ms = write_ms
+        self.on_write = on_write
+        self.written = []
+
+    def is_connected(self):
+        return True
+
+    def services(self):
+        return []
+
+    def write_request(self, service, characteristic, data):
+        start = time.monotonic()
+        if self.write_ms > 0:
+            time.sleep(self.write_ms / 1000)
+        end = time.monotonic()
+        self.written.append(data[0])
+        if self.on_write is not None:
+            self.on_write(start, end)
+
+    write_command = write_request
+
+
+class Benchmark:
+    def __init__(self, ob, arduino, draw=False):
+        self.ob = ob
+        self.arduino = arduino
+        self.draw = draw
+        self.samples = {}
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.inferred = 0
+        self.frame_time = None
+        self.led_requested = None
+        self.led_frame_time = None
+        self.duration = None
+
+        self.arduino.on_write = self.led_written
+        self.instrument()
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.samples.setdefault(stage, []).append(seconds * 1000)
+
+    def timed(self, stage, function):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            self.add(stage, time.perf_counter() - start)
+            return result
+        return wrapper
+
+    def instrument(self):
+        ob = self.ob
+        get_latest = self.timed("capture", ob.cam.get_latest)
+        actuation = self.timed("distance", ob.actuation)
+        inference = self.timed("inference", ob.inference)
+        update_leds = ob.update_leds
+
+        def capture(*args, **kwargs):
+            latest = get_latest(*args, **kwargs)
+            if latest is not None:
+                self.frames += 1
+                self.frame_time = latest[1]
+            return latest
+
+        def infer(input_data):
+            self.inferred += 1
+            return inference(input_data)
+
+        def show(frame_seq, frame, detections):
+            if self.draw:
+                start = time.perf_counter()
+                frame = frame.copy()
+                overlay.draw_detections(frame, detections, ob.labels)
+                self.add("draw", time.perf_counter() - start)
+            return frame
+
+        def actuate(detections, frame_time, frame, data_saver, frame_seq=-1):
+            actuation(detections, frame_time, frame, data_saver, frame_seq)
+            self.add("end_to_end", time.monotonic() - frame_time)
+
+        def leds(shortest_distance, frame_time):
+            previous = ob.led_val
+            update_leds(shortest_distance, frame_time)
+            if ob.led_val != previous:
+                with self.lock:
+                    self.led_requested = ob.led_val
+                    self.led_frame_time = frame_time
+
+        ob.cam.get_latest = capture
+        ob.preprocess = self.timed("preprocess", ob.preprocess)
+        ob.inference = infer
+        ob.postprocess = self.timed("decode", ob.postprocess)
+        ob.show = show
+        ob.actuation = actuate
+        ob.update_leds = leds
+
+    def led_written(self, start, end):
+        self.add("ble_write", end - start)
+        with self.lock:
+            frame_time = self.led_frame_time
+            self.led_frame_time = None
+        if frame_time is not None:
+            self.add("frame_to_led", end - frame_time)
+
+    def run(self):
+        start = time.monotonic()
+        self.ob.object_detect(False, self.arduino)
+        self.duration = time.monotonic() - start
+        # The Arduino is written in the background, the last LED change may still be on its way.
+        time.sleep(0.1)
+
+    def results(self):
+        stages = {stage: summarize(samples) for stage, samples in self.samples.items()}
+        return {"frames": self.frames,
+                "inferred": self.inferred,
+                "duration_s": self.duration,
+                "fps": self.frames / self.duration if self.duration else 0.0,
+                "inference_fps": self.inferred / self.duration if self.duration else 0.0,
+                "stages": stages}
+
+
+# ===========================================================================================================
+# ================================================ FUNCTIONS ================================================
+# ===========================================================================================================
+def summarize(samples):
+    samples = np.asarray(samples, dtype=np.float64)
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {"count": int(samples.size),
+            "mean": float(samples.mean()),
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+            "max": float(samples.max())}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    print("Frames: {}, inferred: {}, {:.1f} FPS, {:.1f} inferences per second".format(
+        results["frames"], results["inferred"], results["fps"], results["inference_fps"]))
+    print("{:<14}{:>8}{:>10}{:>10}{:>10}{:>10}{:>10}".format("stage [ms]", "count", "mean", "p50", "p95", "p99",
+                                                           "max"))
+    for stage, stats in results["stages"].items():
+        print("{:<14}{:>8}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}".format(
+            stage, stats["count"], stats["mean"], stats["p50"], stats["p95"], stats["p99"], stats["max"]))
+
+
+def compare_results(old, new):
+    print("Compared with {} ({}):".format(old.get("commit"), old.get("created")))
+    print("{:<14}{:>12}{:>12}{:>12}".format("stage [ms]", "p50", "p95", "p99"))
+    for stage, stats in new["stages"].items():
+        old_stats = old["stages"].get(stage)
+        if old_stats is None:
+            continue
+        print("{:<14}{:>+12.3f}{:>+12.3f}{:>+12.3f}".format(stage, stats["p50"] - old_stats["p50"],
+                                                           stats["p95"] - old_stats["p95"],
+                                                           stats["p99"] - old_stats["p99"]))
+    print("FPS: {:+.1f}".format(new["fps"] - old["fps"]))
+
+
+# ===========================================================================================================
+# ================================================== MAIN ===================================================
+# ===========================================================================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source",
+                        help="video file, directory of JPEG images or .npy frame dump")
+    parser.add_argument("--output", default="benchmark.json",
+                        help="JSON file the results are written to")
+    parser.add_argument("--compare", default=None,
+                        help="JSON file of an earlier run to compare the results with")
+    parser.add_argument("--invoke-ms", type=float, default=10.0,
+                        help="time of one inference of the stub backend in milliseconds")
+    parser.add_argument("--ble-write-ms", type=float, default=0.0,
+                        help="time of one LED write to the fake Arduino in milliseconds")
+    parser.add_argument("--backend", choices=["stub", "edgetpu", "cpu", "auto"], default="stub",
+                        help="inference backend the frames are processed with")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="number of CPU threads of the inference backend")
+    parser.add_argument("--draw", action="store_true",
+                        help="also measure drawing the detections into every frame")
+    parser.add_argument("--distance-window", type=int, default=10,
+                        help="number of frames combined to the distance shown by the LEDs")
+    parser.add_argument("--roi", type=regions.parse_bounds, default=None,
+                        help="road region the model runs on as x_min,y_min,x_max,y_max in fractions of the frame")
+    parser.add_argument("--far-field", type=regions.parse_bounds, default=None,
+                        help="region of distant vehicles covered with full resolution tiles, format as --roi")
+    parser.add_argument("--tile-budget", type=int, default=0,
+                        help="number of far field tiles the model additionally runs on per frame")
+    args = parser.parse_args()
+
+    source = frame_source.open_source(args.source)
+    backend = backends.StubBackend(invoke_ms=args.invoke_ms) if args.backend == "stub" else args.backend
+    ob = object_detection.ObjectDetection(display_mode="headless", distance_window=args.distance_window,
+                                          frame_source=source, backend=backend, num_threads=args.threads,
+                                          roi_bounds=args.roi, far_field=args.far_field, tile_budget=args.tile_budget)
+    benchmark = Benchmark(ob, FakeArduino(args.ble_write_ms), args.draw)
+    benchmark.run()
+
+    results = benchmark.results()
+    results.update({"commit": git_commit(),
+                    "created": datetime.now().isoformat(timespec="seconds"),
+                    "settings": {"source": args.source,
+                                 "resolution": [ob.imW, ob.imH],
+                                 "backend": ob.backend.name,
+                                 "threads": ob.backend.num_threads,
+                                 "backend_ms": ob.inference_ms,
+                                 "invoke_ms": args.invoke_ms if args.backend == "stub" else None,
+                                 "ble_write_ms": args.ble_write_ms,
+                                 "draw": args.draw,
+                                 "distance_window": args.distance_window,
+                                 "roi": args.roi,
+                                 "far_field": args.far_field,
+                                 "tile_budget": args.tile_budget}})
+    print_results(results)
+    with open(args.output, "w") as json_file:
+        json.dump(results, json_file, indent=4)
+    print("Results written to {}".format(args.output))
+
+    if args.compare is not None:
+        with open(args.compare, "r") as json_file:
+            compare_results(json.load(json_file), results)
@@ -28,6 +28,15 @@ py:module::         cal_val_DINA4
                      determining the bounding boxes. Another reason to use a DINA4 paper for the "calibration" process
                      is the rectangular shape of the paper which matches the shape of the bounding boxes,
                      improving the accuracy of the value for "width of the object in the image".
+
+                     With "--batch" all images of the folder are measured at once, without showing them, in
+                     "--processes" processes. The known distance of every image is read from its file name
+                     (e.g. "1,5m_DINA4.jpg"). The focal length is fitted by least squares over all images with a known
+                     distance: with x = actual width / known distance, the width in the image is focal length * x, so
+                        focal length = sum(x * width in the image) / sum(x * x)
+                     The fit, the residual of every image (in pixels and in meters) and the distances calculated with
+                     the fitted focal length are written to the JSON file in one go. Images in which no marker is
+                     found or which have another size than the first image are listed with the reason.
 * Author:           Joanna Rieger
 * Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
                       eines rückwärtigen Abstands- und Annäherungswarners"
@@ -49,9 +58,12 @@ py:module::         cal_val_DINA4
 # ===========================================================================================================
 # ================================================= IMPORTS =================================================
 # ===========================================================================================================
+import argparse
 import json
 import os
+import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import imutils
 import cv2
@@ -110,47 +122,162 @@ def distance_to_camera(known_width, focal_length, per_width):
     return (known_width * focal_length) / per_width
 
 
+def known_distance(file_name):
+    match = re.match(r'(\d+(?:[.,]\d+)?)m', file_name)
+    if match is None:
+        return None
+    return float(match.group(1).replace(',', '.'))
+
+
+def init_worker():
+    # Every process works on its own images, more OpenCV threads per process would only compete for the cores.
+    cv2.setNumThreads(1)
+
+
+def measure_image(image_path):
+    image = cv2.imread(image_path)
+    if image is None:
+        return {"error": "image can not be read"}
+    try:
+        marker = find_marker(image)
+    except ValueError:
+        return {"error": "no marker found"}
+    return {"width Bounding Box": float(marker[1][0]),
+            "image width": image.shape[1],
+            "image height": image.shape[0]}
+
+
+def fit_focal_length(widths, distances, known_width):
+    x = known_width / np.asarray(distances, dtype=np.float64)
+    widths = np.asarray(widths, dtype=np.float64)
+    return float(np.dot(x, widths) / np.dot(x, x))
+
+
+def batch_calibration(cal, known_width, processes=None):
+    file_names = sorted(file for file in os.listdir(cal.images_path) if file.endswith(".jpg"))
+    image_paths = [os.path.join(cal.images_path, file_name) for file_name in file_names]
+    with ProcessPoolExecutor(processes, initializer=init_worker) as executor:
+        results = dict(zip(file_names, executor.map(measure_image, image_paths, chunksize=4)))
+
+    measured = [file_name for file_name in file_names if "error" not in results[file_name]]
+    if not measured:
+        raise ValueError("No marker found in the images of {}".format(cal.images_path))
+    image_size = (results[measured[0]]["image width"], results[measured[0]]["image height"])
+    for file_name in measured:
+        result = results[file_name]
+        if (result["image width"], result["image height"]) != image_size:
+            result["error"] = "image size {}x{} differs from {}x{}".format(
+                result["image width"], result["image height"], *image_size)
+        result["known distance"] = known_distance(file_name)
+    fit_files = [file_name for file_name in file_names
+                 if "error" not in results[file_name] and results[file_name]["known distance"]]
+    if not fit_files:
+        raise ValueError("No image with a known distance in its file name")
+
+    widths = np.array([results[file_name]["width Bounding Box"] for file_name in fit_files])
+    distances = np.array([results[file_name]["known distance"] for file_name in fit_files])
+    focal_length = fit_focal_length(widths, distances, known_width)
+    residuals_px = widths - focal_length * known_width / distances
+    residuals_m = known_width * focal_length / widths - distances
+
+    cal.calibration_dict["calibration image"] = {
+        "image used": "least squares fit over {} images".format(len(fit_files)),
+        "focal length": focal_length,
+        "known width object": known_width,
+        "image width": image_size[0],
+        "image height": image_size[1],
+        "images used": fit_files,
+        "rms residual px": float(np.sqrt(np.mean(residuals_px ** 2))),
+        "rms residual m": float(np.sqrt(np.mean(residuals_m ** 2))),
+        "max residual m": float(np.max(np.abs(residuals_m)))}
+    for file_name in file_names:
+        result = results[file_name]
+        if "error" in result:
+            cal.calibration_dict[file_name] = {"error": result["error"]}
+            continue
+        entry = {"width Bounding Box": result["width Bounding Box"],
+                 "distance Object": distance_to_camera(known_width, focal_length, result["width Bounding Box"]),
+                 "known distance": result["known distance"],
+                 "width Object": known_width,
+                 "focal length": focal_length}
+        if file_name in fit_files:
+            index = fit_files.index(file_name)
+            entry["residual px"] = float(residuals_px[index])
+            entry["residual m"] = float(residuals_m[index])
+        cal.calibration_dict[file_name] = entry
+    return focal_length
+
+
+def print_calibration(calibration_dict):
+    fit = calibration_dict["calibration image"]
+    print("Focal length {:.2f} from {} images, RMS residual {:.2f} px / {:.3f} m".format(
+        fit["focal length"], len(fit["images used"]), fit["rms residual px"], fit["rms residual m"]))
+    print("{:<24}{:>10}{:>10}{:>10}{:>12}".format("image", "width px", "known m", "calc m", "residual m"))
+    for file_name, entry in calibration_dict.items():
+        if file_name == "calibration image":
+            continue
+        if "error" in entry:
+            print("{:<24}{}".format(file_name, entry["error"]))
+            continue
+        known = entry["known distance"]
+        print("{:<24}{:>10.1f}{:>10}{:>10.3f}{:>12}".format(
+            file_name, entry["width Bounding Box"], "-" if known is None else "{:.2f}".format(known),
+            entry["distance Object"], "{:+.3f}".format(entry["residual m"]) if "residual m" in entry else "-"))
+
+
 # ===========================================================================================================
 # ================================================== MAIN ===================================================
 # ===========================================================================================================
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", action="store_true",
+                        help="fit the focal length over all images without showing them")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="number of processes measuring the images in the batch mode (default: all cores)")
+    args = parser.parse_args()
     cal = Calibration()
     KNOWN_DISTANCE = 2.0
     KNOWN_WIDTH = 0.297
-    cal_image_path = cal.images_path + cal.cal_file_name
-    print(cal_image_path)
-    image = cv2.imread(cal_image_path)
-    marker = find_marker(image)
-    box = cv2.boxPoints(marker)
-    box = np.intp(box)
-    cv2.drawContours(image, [box], -1, (0, 255, 0), 2)
-    cv2.imshow("image", image)
-    cv2.waitKey(5000)
-    focalLength = (marker[1][0] * KNOWN_DISTANCE) / KNOWN_WIDTH
-    focal_length_dict = {"image used": cal_image_path,
-                         "focal length": focalLength,
-                         "known distance object": KNOWN_DISTANCE,
-                         "known width object": KNOWN_WIDTH}
-    cal.calibration_dict["calibration image"] = focal_length_dict
-
-    for i in range(cal.jpg_count):
-        val_image_path = cal.images_path + cal.file_name[i]
-        print(val_image_path)
-        image = cv2.imread(val_image_path)
+    if args.batch:
+        batch_calibration(cal, KNOWN_WIDTH, args.processes)
+        print_calibration(cal.calibration_dict)
+    else:
+        cal_image_path = cal.images_path + cal.cal_file_name
+        print(cal_image_path)
+        image = cv2.imread(cal_image_path)
         marker = find_marker(image)
-        meter = distance_to_camera(KNOWN_WIDTH, focalLength, marker[1][0])
         box = cv2.boxPoints(marker)
         box = np.intp(box)
         cv2.drawContours(image, [box], -1, (0, 255, 0), 2)
-        cv2.putText(image, "%.2fm" % meter,
-                    (image.shape[1] - 200, image.shape[0] - 20), cv2.FONT_HERSHEY_SIMPLEX,
-                    2.0, (0, 255, 0), 3)
         cv2.imshow("image", image)
-        cv2.waitKey(3000)
-        add_to_dict = {"width Bounding Box": marker[1][0],
-                       "distance Object": meter,
-                       "width Object": KNOWN_WIDTH,
-                       "focal length": focalLength}
-        cal.calibration_dict[cal.file_name[i]] = add_to_dict
+        cv2.waitKey(5000)
+        focalLength = (marker[1][0] * KNOWN_DISTANCE) / KNOWN_WIDTH
+        focal_length_dict = {"image used": cal_image_path,
+                             "focal length": focalLength,
+                             "known distance object": KNOWN_DISTANCE,
+                             "known width object": KNOWN_WIDTH,
+                             "image width": image.shape[1],
+                             "image height": image.shape[0]}
+        cal.calibration_dict["calibration image"] = focal_length_dict
+
+        for i in range(cal.jpg_count):
+            val_image_path = cal.images_path + cal.file_name[i]
+            print(val_image_path)
+            image = cv2.imread(val_image_path)
+            marker = find_marker(image)
+            meter = distance_to_camera(KNOWN_WIDTH, focalLength, marker[1][0])
+            box = cv2.boxPoints(marker)
+            box = np.intp(box)
+            cv2.drawContours(image, [box], -1, (0, 255, 0), 2)
+            cv2.putText(image, "%.2fm" % meter,
+                        (image.shape[1] - 200, image.shape[0] - 20), cv2.FONT_HERSHEY_SIMPLEX,
+                        2.0, (0, 255, 0), 3)
+            cv2.imshow("image", image)
+            cv2.waitKey(3000)
+            add_to_dict = {"width Bounding Box": marker[1][0],
+                           "distance Object": meter,
+                           "width Object": KNOWN_WIDTH,
+                           "focal length": focalLength}
+            cal.calibration_dict[cal.file_name[i]] = add_to_dict
 
     cal.fill_json_with_content()
@@ -6,10 +6,9 @@ py:module::         image_collect_test_od
                      real-world scenario. It operates similarly to the "main.py" module.
                      The difference being that the variable "to_save" is set to "True". This setting enables the
                      "object_detection" module to call the "save_data" function to save webcam frames with the plotted
-                     bounding boxes and the calculated distances for each bounding box. The data is also appended to a
-                     JSON file for later review. The data saving occurs every 5 seconds.
-                     !Attention! The program will not run if a file named "picamera_test.json" already exists in the
-                     camera directory before the program starts.
+                     bounding boxes and the calculated distances for each bounding box. The data is also appended to
+                     the JSON Lines file "picamera_test.jsonl" (one JSON object per line) for later review. The data
+                     saving occurs every 5 seconds.
 * Author:           Joanna Rieger
 * Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
                       eines rückwärtigen Abstands- und Annäherungswarners"
@@ -8,6 +8,14 @@ py:module::         object_detection_imgs
                      The collected data is returned to the validation module, which called the "object_detect_img"
                      function of this module. The data is used in the validation process to compute the distance
                      between the camera and the detected object.
+                     The model is loaded once per "ObjectDetectionImgs". "load_image" only reads and resizes an image
+                     and can run in other threads while "detect" runs the model on the previous image. The image is
+                     only annotated and shown if "object_detect_img" is called with "show". "infer" returns the raw
+                     outputs of the model, which "evaluate" turns into the width of the bounding box and the class,
+                     so raw outputs stored in the "OutputCache" can be evaluated without running the model.
+                     The images are written into the input of the model by "ModelInput", like the camera frames, so
+                     float and int8 models (e.g. the CPU model) get the same normalized input as in the live system.
+                     Each loader thread has its own "ModelInput", because its scratch buffers cannot be shared.
 * Author:           Joanna Rieger
 * Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
                       eines rückwärtigen Abstands- und Annäherungswarners"
@@ -33,26 +41,27 @@ py:module::         object_detection_imgs
 # ================================================= IMPORTS =================================================
 # ===========================================================================================================
 import os
-import numpy as np
+import sys
+import threading
 import cv2
 import validation
 
-from tflite_runtime.interpreter import Interpreter
-from tflite_runtime.interpreter import load_delegate
+sys.path.append('/home/hshl/smb-safety_system')
+from src import backends
+from src import decoding
+from src import model_input
 
 
 # ===========================================================================================================
 # ================================================= CLASSES =================================================
 # ===========================================================================================================
 class ObjectDetectionImgs:
-    def __init__(self):
+    def __init__(self, backend="auto", num_threads=None):
         print("Object Detection initialization started!")
         self.stopped = False
         self.MODEL_NAME = "/home/hshl/smb-safety_system/config/tensorflow/custom_model_lite/"
-        self.GRAPH_NAME = "edgetpu.tflite"
         self.LABELMAP_NAME = "labelmap.txt"
         self.CWD_PATH = os.getcwd()
-        self.PATH_TO_TFLITE = os.path.join(self.CWD_PATH, self.MODEL_NAME, self.GRAPH_NAME)
         self.PATH_TO_LABELS = os.path.join(self.CWD_PATH, self.MODEL_NAME, self.LABELMAP_NAME)
         self.min_conf_threshold = 0.5
         self.resW = 640
@@ -62,58 +71,80 @@ class ObjectDetectionImgs:
 
         with open(self.PATH_TO_LABELS, 'r') as f:
             self.labels = [line.strip() for line in f.readlines()]
+        self.decoder = decoding.DetectionDecoder(self.labels, self.imW, self.imH, self.min_conf_threshold)
+        self.detections = None
 
-        self.interpreter = Interpreter(model_path=self.PATH_TO_TFLITE,
-                                       experimental_delegates=[load_delegate('libedgetpu.so.1.0')])
-
-        self.interpreter.allocate_tensors()
+        self.backend, self.interpreter = backends.load_backend(backend, os.path.join(self.CWD_PATH, self.MODEL_NAME),
+                                                               num_threads)
+        print("Inference backend: {}".format(self.backend.name))
 
         self.input_details = self.interpreter.get_input_details()
         self.output_details = self.interpreter.get_output_details()
         self.height = self.input_details[0]['shape'][1]
         self.width = self.input_details[0]['shape'][2]
+        self.model_input = model_input.ModelInput(self.interpreter, self.input_details[0])
+        self.loader_inputs = threading.local()
 
         self.boxes_idx, self.classes_idx, self.scores_idx = 1, 3, 0
 
-    def object_detect_img(self, filename):
-        wbb = 0
-        cob = "NO CLASS DETECTED"
+    def object_detect_img(self, filename, show=True):
         frame_img = cv2.imread(filename)
-        frame_rgb = cv2.cvtColor(frame_img, cv2.COLOR_BGR2RGB)
-        frame_resized = cv2.resize(frame_rgb, (self.width, self.height))
-        input_data = np.expand_dims(frame_resized, axis=0)
+        wbb, cob = self.detect(self.preprocess(frame_img))
+        if show:
+            self.draw(frame_img)
+        return wbb, cob
+
+    def load_image(self, filename):
+        return self.preprocess(cv2.imread(filename))
+
+    def preprocess(self, frame_img):
+        loader_input = getattr(self.loader_inputs, "model_input", None)
+        if loader_input is None:
+            loader_input = model_input.ModelInput(self.interpreter, self.input_details[0])
+            self.loader_inputs.model_input = loader_input
+        return loader_input.write(frame_img, out=loader_input.new_buffer())
+
+    def detect(self, input_data):
+        return self.evaluate(*self.infer(input_data))
 
-        self.interpreter.set_tensor(self.input_details[0]['index'], input_data)
+    def infer(self, input_data):
+        self.model_input.load(input_data)
         self.interpreter.invoke()
 
         boxes = self.interpreter.get_tensor(self.output_details[self.boxes_idx]['index'])[0]
         classes = self.interpreter.get_tensor(self.output_details[self.classes_idx]['index'])[0]
         scores = self.interpreter.get_tensor(self.output_details[self.scores_idx]['index'])[0]
+        return boxes, classes, scores
 
-        for i in range(len(scores)):
-            if (scores[i] > self.min_conf_threshold) and (scores[i] <= 1.0):
-                ymin = int(max(1, (boxes[i][0] * self.imH)))
-                xmin = int(max(1, (boxes[i][1] * self.imW)))
-                ymax = int(min(self.imH, (boxes[i][2] * self.imH)))
-                xmax = int(min(self.imW, (boxes[i][3] * self.imW)))
-                wbb = self.width_bounding_box(xmin, xmax)
-
-                cv2.rectangle(frame_img, (xmin, ymin), (xmax, ymax), (252, 15, 192), 2)
-
-                object_name = self.labels[int(classes[i])]
-                cob = object_name
-                label = '%s: %d%%' % (object_name, int(scores[i] * 100))
-                label_size, base_line = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)
-                label_ymin = max(ymin, label_size[1] + 10)
-                cv2.rectangle(frame_img, (xmin, label_ymin - label_size[1] - 10),
-                              (xmin + label_size[0], label_ymin + base_line - 10), (255, 255, 255),
-                              cv2.FILLED)
-                cv2.putText(frame_img, label, (xmin, label_ymin - 7), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0),
-                            2)
+    def evaluate(self, boxes, classes, scores):
+        wbb = 0
+        cob = "NO CLASS DETECTED"
+        self.detections = self.decoder.decode(boxes, classes, scores)
+        # The images contain exactly one car, so the last detection is used.
+        if len(self.detections):
+            wbb = int(self.detections[-1]["width"])
+            cob = self.decoder.label(self.detections[-1]["class_id"])
+        return wbb, cob
+
+    def draw(self, frame_img):
+        for detection in self.detections:
+            xmin, ymin = int(detection["xmin"]), int(detection["ymin"])
+            xmax, ymax = int(detection["xmax"]), int(detection["ymax"])
+
+            cv2.rectangle(frame_img, (xmin, ymin), (xmax, ymax), (252, 15, 192), 2)
+
+            object_name = self.decoder.label(detection["class_id"])
+            label = '%s: %d%%' % (object_name, int(detection["score"] * 100))
+            label_size, base_line = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)
+            label_ymin = max(ymin, label_size[1] + 10)
+            cv2.rectangle(frame_img, (xmin, label_ymin - label_size[1] - 10),
+                          (xmin + label_size[0], label_ymin + base_line - 10), (255, 255, 255),
+                          cv2.FILLED)
+            cv2.putText(frame_img, label, (xmin, label_ymin - 7), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0),
+                        2)
 
         cv2.imshow('Object detector', frame_img)
         cv2.waitKey(1)
-        return wbb, cob
 
     @staticmethod
     def width_bounding_box(x_min, x_max):
@@ -0,0 +1,98 @@
+"""
+py:module::         output_cache
+
+* Filename:         output_cache.py
+* Description:      This module contains the "OutputCache" class, an on-disk cache of the raw outputs of the object
+                     detection model for the offline tools (e.g. "validation.py"). The outputs of an image are stored
+                     under the SHA-256 hash of the image file and of the model file, so an image is only run through
+                     the model again if the image or the model changed. The boxes, classes and scores of an image are
+                     stored together in one NumPy file with one row per detection:
+                        ymin, xmin, ymax, xmax, class, score
+                     The files are opened memory-mapped, so reading the outputs of a whole validation set takes only
+                     milliseconds. The outputs are stored before the confidence threshold is applied, so the tools
+                     can decode them with any threshold.
+* Author:           Joanna Rieger
+* Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
+                      eines rückwärtigen Abstands- und Annäherungswarners"
+* E-Mail:           joanna.rieger@stud.hshl.de
+* Project Sources:
+    * Source:           https://github.com/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi
+    * Source:           https://colab.research.google.com/github/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi/blob/master/Train_TFLite2_Object_Detction_Model.ipynb
+    * Source:           https://pyimagesearch.com/2015/01/19/find-distance-camera-objectmarker-using-python-opencv/
+    * Source:           https://www.welt.de/motor/news/article244937978/Jedes-Jahr-ein-Zentimeter-mehr-Laengenwachstum-bei-Pkw.html#:~:text=Zwischen%202000%20und%202022%20ist,von%20einem%20Zentimeter%20pro%20Jahr.
+    * Source:           https://www.ardalpha.de/wissen/geschichte/kulturgeschichte/din-a4-din-normen-100-jahre-100.html#:~:text=Die%20wohl%20bekannteste%20DIN%2DNorm%20ist%20die%20DIN%20EN%20ISO,noch%20in%20den%20Drucker%20legen.
+    * Source:           https://jashuang1983.wordpress.com/rpi4-ble-with-arduino-nano-33/
+    * Source:           https://docs.arduino.cc/tutorials/nano-33-ble-sense/bluetooth/
+    * Source:           https://github.com/OpenBluetoothToolbox/SimpleBLE/blob/main/examples/simplepyble/write.py
+    * Source:           https://blog.finxter.com/5-best-ways-to-convert-python-csv-to-xml-using-elementtree/
+    * Source:           https://stackoverflow.com/questions/15679467/parse-all-the-xml-files-in-a-directory-one-by-one-using-elementtree
+    * Source:           https://chatgpt.com/
+"""
+
+# ===========================================================================================================
+# ================================================= IMPORTS =================================================
+# ===========================================================================================================
+import hashlib
+import os
+import sys
+import numpy as np
+
+sys.path.append('/home/hshl/smb-safety_system')
+from src import main
+
+
+# ===========================================================================================================
+# ================================================= CLASSES =================================================
+# ===========================================================================================================
+class OutputCache:
+    def __init__(self, backend, cache_dir=None):
+        self.cache_dir = cache_dir if cache_dir is not None else main.Paths().output_cache_path
+        self.model_hash = model_hash(backend)
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, image_hash):
+        key = hashlib.sha256((self.model_hash + image_hash).encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key + ".npy")
+
+    def get(self, image_hash):
+        path = self.path(image_hash)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        outputs = np.load(path, mmap_mode="r")
+        self.hits += 1
+        return outputs[:, :4], outputs[:, 4], outputs[:, 5]
+
+    def put(self, image_hash, boxes, classes, scores):
+        path = self.path(image_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        outputs = np.column_stack((np.asarray(boxes, dtype=np.float32),
+                                   np.asarray(classes, dtype=np.float32),
+                                   np.asarray(scores, dtype=np.float32)))
+        # Written under a temporary name first, so other processes never read a half written file.
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "wb") as cache_file:
+            np.save(cache_file, outputs)
+        os.replace(tmp_path, path)
+
+
+# ===========================================================================================================
+# ================================================ FUNCTIONS ================================================
+# ===========================================================================================================
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def image_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def model_hash(backend):
+    if backend.model_path is None:
+        return backend.name
+    return backend.name + ":" + file_hash(backend.model_path)
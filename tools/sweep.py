@@ -0,0 +1,182 @@
+"""
+py:module::         sweep
+
+* Filename:         sweep.py
+* Description:      This module evaluates different settings of the distance warning on the validation images
+                     without running the model for every setting. The model is run once per image through
+                     "validation.py" (and its "OutputCache", so usually not at all), then the stored raw outputs are
+                     evaluated for every combination of:
+                        - confidence threshold  (--thresholds, "min_conf_threshold" of the object detection)
+                        - tolerance             (--tolerances, the ±5 m window of "validation.py")
+                        - LED bands             (--red and --yellow, the 25 m and 50 m of "map_distance_to_leds")
+                     All images and thresholds are evaluated at once with NumPy. Like in "validation.py", the last
+                     detection above the threshold is used for every image. For every setting the table contains:
+                        - detected      ==      share of the images in which a car was detected
+                        - correct       ==      share of the images with a distance within the tolerance
+                        - correct_det   ==      share of the detected cars with a distance within the tolerance
+                        - mae           ==      mean absolute error of the distance of the detected cars in meters
+                        - led_correct   ==      share of the images for which the LEDs show the color of the actual
+                                                 distance (green if no car was detected)
+                        - led_too_safe  ==      share of the images for which the LEDs show a safer color than the
+                                                 actual distance
+                     The table is printed and written into a CSV file.
+* Author:           Joanna Rieger
+* Bachelor thesis:  "Untersuchungen zum Einsatz von KI und Computer Vision für ein Fahrradassistenzsystem am Beispiel
+                      eines rückwärtigen Abstands- und Annäherungswarners"
+* E-Mail:           joanna.rieger@stud.hshl.de
+* Project Sources:
+    * Source:           https://github.com/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi
+    * Source:           https://colab.research.google.com/github/EdjeElectronics/TensorFlow-Lite-Object-Detection-on-Android-and-Raspberry-Pi/blob/master/Train_TFLite2_Object_Detction_Model.ipynb
+    * Source:           https://pyimagesearch.com/2015/01/19/find-distance-camera-objectmarker-using-python-opencv/
+    * Source:           https://www.welt.de/motor/news/article244937978/Jedes-Jahr-ein-Zentimeter-mehr-Laengenwachstum-bei-Pkw.html#:~:text=Zwischen%202000%20und%202022%20ist,von%20einem%20Zentimeter%20pro%20Jahr.
+    * Source:           https://www.ardalpha.de/wissen/geschichte/kulturgeschichte/din-a4-din-normen-100-jahre-100.html#:~:text=Die%20wohl%20bekannteste%20DIN%2DNorm%20ist%20die%20DIN%20EN%20ISO,noch%20in%20den%20Drucker%20legen.
+    * Source:           https://jashuang1983.wordpress.com/rpi4-ble-with-arduino-nano-33/
+    * Source:           https://docs.arduino.cc/tutorials/nano-33-ble-sense/bluetooth/
+    * Source:           https://github.com/OpenBluetoothToolbox/SimpleBLE/blob/main/examples/simplepyble/write.py
+    * Source:           https://blog.finxter.com/5-best-ways-to-convert-python-csv-to-xml-using-elementtree/
+    * Source:           https://stackoverflow.com/questions/15679467/parse-all-the-xml-files-in-a-directory-one-by-one-using-elementtree
+    * Source:           https://chatgpt.com/
+"""
+
+# ===========================================================================================================
+# ================================================= IMPORTS =================================================
+# ===========================================================================================================
+import argparse
+import csv
+import itertools
+import sys
+import numpy as np
+
+sys.path.append('/home/hshl/smb-safety_system')
+from src import mapping
+import validation
+
+COLUMNS = ["threshold", "tolerance", "red", "yellow", "detected", "correct", "correct_det", "mae", "led_correct",
+           "led_too_safe"]
+
+
+# ===========================================================================================================
+# ================================================= CLASSES =================================================
+# ===========================================================================================================
+class ThresholdSweep:
+    def __init__(self, outputs, actual_distances, class_widths, focal_length, im_w=640):
+        if not outputs:
+            raise ValueError("No model outputs to sweep, the validation set contains no images")
+        count = max(len(scores) for _, _, scores in outputs)
+        self.boxes = np.zeros((len(outputs), count, 4), dtype=np.float32)
+        self.classes = np.zeros((len(outputs), count), dtype=np.int64)
+        self.scores = np.zeros((len(outputs), count), dtype=np.float32)
+        for i, (boxes, classes, scores) in enumerate(outputs):
+            self.boxes[i, :len(scores)] = boxes
+            self.classes[i, :len(scores)] = classes
+            self.scores[i, :len(scores)] = scores
+        self.actual_distances = np.asarray(actual_distances, dtype=np.float64)
+        self.class_widths = np.asarray(class_widths, dtype=np.float64)
+        self.focal_length = focal_length
+        # Same rounding as the "DetectionDecoder", which stores the box coordinates as integers.
+        xmin = np.maximum(1, self.boxes[:, :, 1] * im_w).astype(np.int32)
+        xmax = np.minimum(im_w, self.boxes[:, :, 3] * im_w).astype(np.int32)
+        self.widths = xmax - xmin
+
+    def distances(self, thresholds):
+        thresholds = np.asarray(thresholds, dtype=np.float64)[:, None, None]
+        keep = (self.scores[None] > thresholds) & (self.scores[None] <= 1.0)
+        count = keep.shape[2]
+        last = count - 1 - np.argmax(keep[:, :, ::-1], axis=2)
+        images = np.arange(keep.shape[1])[None, :]
+        widths = self.widths[images, last]
+        detected = keep.any(axis=2) & (widths != 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            distances = self.class_widths[self.classes[images, last]] * self.focal_length / widths
+        return detected, np.where(detected, distances, np.inf)
+
+    def evaluate(self, thresholds, tolerances, red_distances, yellow_distances):
+        detected, distances = self.distances(thresholds)
+        errors = np.abs(distances - self.actual_distances[None])
+        detected_count = detected.sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mae = np.where(detected, errors, 0.0).sum(axis=1) / detected_count
+
+        rows = []
+        for (t, threshold), tolerance in itertools.product(enumerate(thresholds), tolerances):
+            correct = detected[t] & (errors[t] <= tolerance)
+            for red, yellow in itertools.product(red_distances, yellow_distances):
+                if red >= yellow:
+                    continue
+                shown = led_bands(distances[t], red, yellow)
+                actual = led_bands(self.actual_distances, red, yellow)
+                rows.append({"threshold": threshold,
+                             "tolerance": tolerance,
+                             "red": red,
+                             "yellow": yellow,
+                             "detected": detected[t].mean(),
+                             "correct": correct.mean(),
+                             "correct_det": correct.sum() / detected_count[t] if detected_count[t] else 0.0,
+                             "mae": mae[t],
+                             "led_correct": np.mean(shown == actual),
+                             "led_too_safe": np.mean(shown > actual)})
+        return rows
+
+
+# ===========================================================================================================
+# ================================================ FUNCTIONS ================================================
+# ===========================================================================================================
+def led_bands(distances, red, yellow):
+    # 0 red, 1 yellow, 2 green like in "map_distance_to_leds", so a higher band is a safer color.
+    return np.digitize(distances, [red, yellow])
+
+
+def print_rows(rows):
+    print("".join("{:>13}".format(column) for column in COLUMNS))
+    for row in rows:
+        print("".join("{:>13.3f}".format(row[column]) for column in COLUMNS))
+
+
+def write_rows(rows, csv_path):
+    with open(csv_path, "w", newline="") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({column: round(float(row[column]), 4) for column in COLUMNS})
+
+
+# ===========================================================================================================
+# ================================================== MAIN ===================================================
+# ===========================================================================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.3, 0.4, 0.5, 0.6, 0.7, 0.8],
+                        help="confidence thresholds to evaluate")
+    parser.add_argument("--tolerances", type=float, nargs="+", default=[2.0, 5.0, 10.0],
+                        help="maximum distance errors in meters that count as correct")
+    parser.add_argument("--red", type=float, nargs="+", default=[mapping.RED_DISTANCE],
+                        help="distances in meters below which the red LED is switched on")
+    parser.add_argument("--yellow", type=float, nargs="+", default=[mapping.YELLOW_DISTANCE],
+                        help="distances in meters below which the yellow LED is switched on")
+    parser.add_argument("--output", default="sweep.csv",
+                        help="CSV file the table is written to")
+    parser.add_argument("--backend", choices=["auto", "edgetpu", "cpu"], default="auto",
+                        help="inference backend for the images that are not in the output cache")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="number of processes running the model (only with --backend cpu)")
+    args = parser.parse_args()
+    if args.processes > 1 and args.backend != "cpu":
+        args.processes = 1
+
+    val = validation.ValidationDistanceCalculation(args.backend)
+    if not val.jpg_count:
+        print("No validation images (.jpg) found in {}, nothing to sweep".format(val.path))
+        sys.exit(1)
+    raw_outputs = val.infer_all_imgs(processes=args.processes)
+    actual = []
+    for i in range(val.jpg_count):
+        val.check_distance(i)
+        actual.append(val.val_distance)
+
+    decoder = val.get_object_detection().decoder
+    sweep = ThresholdSweep(raw_outputs, actual, decoder.class_widths, mapping.DistanceCalc().focal_length,
+                           decoder.imW)
+    results = sweep.evaluate(args.thresholds, args.tolerances, args.red, args.yellow)
+    print_rows(results)
+    write_rows(results, args.output)
+    print("Table written to {}".format(args.output))
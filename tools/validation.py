@@ -23,6 +23,12 @@ py:module::         validation
                      the number of objects detected with incorrect distances, and the number of objects detected with
                      correct distances. These statistics are printed to the terminal for the evaluation of the distance
                      calculation using the created object detection model.
+                     The model is loaded only once and nothing is shown on the display. While the model runs on one
+                     image, the next images are read and resized by "--loaders" threads. With the CPU backend the
+                     images can also be split over "--processes" processes, each with its own model; the Edge TPU can
+                     only be used by one process.
+                     The raw outputs of the model are stored in the "OutputCache" of "output_cache.py", so only new or
+                     changed images are run through the model again; "--no-cache" runs the model on every image.
                      !Attention! The module assumes that there is exactly one car per image and that the images are
                      named according to the specific convention given in the "image_collect.py".
 * Author:           Joanna Rieger
@@ -46,22 +52,30 @@ py:module::         validation
 # ===========================================================================================================
 # ================================================= IMPORTS =================================================
 # ===========================================================================================================
+import argparse
+import itertools
 import os
 import sys
 import re
 import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append('/home/hshl/smb-safety_system')
 from src import main
 from src import mapping
+import cv2
+import numpy as np
 import object_detection_imgs
+import output_cache
 
 
 # ===========================================================================================================
 # ================================================= CLASSES =================================================
 # ===========================================================================================================
 class ValidationDistanceCalculation:
-    def __init__(self):
+    def __init__(self, backend="auto", num_threads=None, use_cache=True):
         self.focal_length = None
         self.jpg_count = None
         self.path = main.Paths().val_imgs_path
@@ -72,6 +86,11 @@ class ValidationDistanceCalculation:
         self.validation_dict = {}
         self.object_detected = None
         self.detected_class = None
+        self.backend = backend
+        self.num_threads = num_threads
+        self.obj_detection = None
+        self.use_cache = use_cache
+        self.detected = None
 
         self.count_jpg_files()
         self.get_file_name()
@@ -115,10 +134,44 @@ class ValidationDistanceCalculation:
         with open(self.json_path, "w") as json_file:
             json.dump(self.validation_dict, json_file, indent=4)
 
+    def get_object_detection(self):
+        if self.obj_detection is None:
+            self.obj_detection = object_detection_imgs.ObjectDetectionImgs(self.backend, self.num_threads)
+        return self.obj_detection
+
+    def detect_all_imgs(self, loaders=4, processes=1):
+        self.detected = self.run_on_all_imgs(detect_files, detect_files_in_worker, loaders, processes)
+        return self.detected
+
+    def infer_all_imgs(self, loaders=4, processes=1):
+        return self.run_on_all_imgs(infer_files, infer_files_in_worker, loaders, processes)
+
+    def run_on_all_imgs(self, function, worker_function, loaders=4, processes=1):
+        file_paths = [self.path + file_name for file_name in self.file_names]
+        if processes <= 1:
+            obj_detection = self.get_object_detection()
+            cache = output_cache.OutputCache(obj_detection.backend) if self.use_cache else None
+            results = list(function(obj_detection, file_paths, loaders, cache))
+            if cache is not None:
+                print("Output cache: {} images read, {} images detected".format(cache.hits, cache.misses))
+            return results
+        chunks = [file_paths[i::processes] for i in range(processes)]
+        threads = self.num_threads if self.num_threads is not None else max(1, os.cpu_count() // processes)
+        with ProcessPoolExecutor(processes, initializer=init_worker,
+                                 initargs=(self.backend, threads, self.use_cache)) as pool:
+            chunk_results = list(pool.map(worker_function, chunks, itertools.repeat(loaders)))
+        # The chunks were interleaved, so the results are put back into the order of the file names.
+        results = [None] * len(file_paths)
+        for i, chunk in enumerate(chunk_results):
+            results[i::processes] = chunk
+        return results
+
     def distance_calculation_imgs(self, k, fl):
-        file_path = self.path + self.file_names[k]
-        obj_detection = object_detection_imgs.ObjectDetectionImgs()
-        width_bounding_box, class_ob = obj_detection.object_detect_img(file_path)
+        if self.detected is not None:
+            width_bounding_box, class_ob = self.detected[k]
+        else:
+            file_path = self.path + self.file_names[k]
+            width_bounding_box, class_ob = self.get_object_detection().object_detect_img(file_path, show=False)
         self.detected_class = class_ob
         if width_bounding_box != 0:
             main_classes = main.SizeClasses()
@@ -154,12 +207,85 @@ class ValidationDistanceCalculation:
         print("Objects detected, correct distance calculated:", counter_odcd)
 
 
+# ===========================================================================================================
+# ================================================ FUNCTIONS ================================================
+# ===========================================================================================================
+worker_detection = None
+worker_cache = None
+
+
+def init_worker(backend, num_threads, use_cache=True):
+    global worker_detection, worker_cache
+    worker_detection = object_detection_imgs.ObjectDetectionImgs(backend, num_threads)
+    worker_cache = output_cache.OutputCache(worker_detection.backend) if use_cache else None
+
+
+def detect_files_in_worker(file_paths, loaders):
+    return detect_files(worker_detection, file_paths, loaders, worker_cache)
+
+
+def infer_files_in_worker(file_paths, loaders):
+    # Outputs read from the cache are memory-mapped and copied before they are sent to the main process.
+    return [tuple(np.array(output) for output in outputs)
+            for outputs in infer_files(worker_detection, file_paths, loaders, worker_cache)]
+
+
+def load_file(obj_detection, file_path, cache=None):
+    with open(file_path, "rb") as image_file:
+        data = image_file.read()
+    image_hash = output_cache.image_hash(data)
+    outputs = cache.get(image_hash) if cache is not None else None
+    if outputs is not None:
+        return image_hash, outputs, None
+    frame_img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return image_hash, None, obj_detection.preprocess(frame_img)
+
+
+def detect_files(obj_detection, file_paths, loaders=4, cache=None):
+    return [obj_detection.evaluate(*outputs) for outputs in infer_files(obj_detection, file_paths, loaders, cache)]
+
+
+def infer_files(obj_detection, file_paths, loaders=4, cache=None):
+    remaining = iter(file_paths)
+    with ThreadPoolExecutor(loaders) as pool:
+        # Only a few images are read ahead, so a large validation set does not have to fit into the memory.
+        pending = deque(pool.submit(load_file, obj_detection, file_path, cache)
+                        for file_path in itertools.islice(remaining, 2 * loaders))
+        while pending:
+            image_hash, outputs, input_data = pending.popleft().result()
+            next_path = next(remaining, None)
+            if next_path is not None:
+                pending.append(pool.submit(load_file, obj_detection, next_path, cache))
+            if outputs is None:
+                outputs = obj_detection.infer(input_data)
+                if cache is not None:
+                    cache.put(image_hash, *outputs)
+            yield outputs
+
+
 # ===========================================================================================================
 # ================================================== MAIN ===================================================
 # ===========================================================================================================
 if __name__ == '__main__':
-    val = ValidationDistanceCalculation()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=["auto", "edgetpu", "cpu"], default="auto",
+                        help="inference backend the images are processed with")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="number of CPU threads of the inference backend per process")
+    parser.add_argument("--loaders", type=int, default=4,
+                        help="number of threads reading and resizing the images")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="number of processes running the model (only with --backend cpu)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="run the model on every image instead of reading stored outputs")
+    args = parser.parse_args()
+    if args.processes > 1 and args.backend != "cpu":
+        print("The Edge TPU can only be used by one process, --processes is ignored")
+        args.processes = 1
+
+    val = ValidationDistanceCalculation(args.backend, args.threads, not args.no_cache)
     focal_length = mapping.DistanceCalc().focal_length
+    val.detect_all_imgs(args.loaders, args.processes)
 
     for i in range(val.jpg_count):
         val.distance_calculation_imgs(i, focal_length)